@@ -0,0 +1,76 @@
+"""
+Measures how long parsing the fixture pages takes and how much memory it needs, for each
+tree builder, with and without the strainers socli uses to only build the parts of a page it reads.
+
+Usage: python benchmarks/parse_pages.py [repeat]
+lxml is measured only if it is installed (pip install socli[lxml]). Needs Python 3 for tracemalloc.
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs4 import BeautifulSoup
+
+import socli.socli as socli
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "fixtures")
+
+# Fixture page and the page_parts() arguments socli parses it with
+pages = [("question.html", socli.QUESTION_PAGE_PARTS),
+         ("search.html", socli.SO_SEARCH_PARTS)]
+
+
+def parsers():
+    """
+    Lists the tree builders which can be measured here.
+    :return: list of parser names
+    """
+    names = ["html.parser"]
+    try:
+        import lxml
+        names.append("lxml")
+    except ImportError:
+        print("lxml is not installed, only html.parser is measured\n")
+    return names
+
+
+def measure(html, parser, parts, repeat):
+    """
+    Parses a page repeatedly.
+    :param html: HTML of the page
+    :param parser: tree builder name
+    :param parts: page_parts() arguments, or None to build the whole tree
+    :param repeat: number of parses to time
+    :return: (milliseconds per parse, best of 3 runs; peak memory of one parse in KiB)
+    """
+    def parse():
+        BeautifulSoup(html, parser, parse_only=socli.page_parts(*parts) if parts else None)
+
+    seconds = min(timeit.repeat(parse, number=repeat, repeat=3)) / repeat
+    tracemalloc.start()
+    parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds * 1000, peak / 1024.0
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    names = parsers()
+    print("{0:<15}{1:<13}{2:<10}{3:>10}{4:>13}".format("page", "parser", "strainer", "ms", "peak KiB"))
+    for name, parts in pages:
+        with open(os.path.join(fixtures, name), "rb") as f:
+            html = f.read().decode("utf-8")
+        for parser in names:
+            for strained in (False, True):
+                ms, peak = measure(html, parser, parts if strained else None, repeat)
+                print("{0:<15}{1:<13}{2:<10}{3:>10.2f}{4:>13.0f}".format(
+                    name, parser, "yes" if strained else "no", ms, peak))
+
+
+if __name__ == "__main__":
+    main()
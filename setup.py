@@ -19,8 +19,9 @@ setup(
     packages=["socli"],
     data_files=[('socli', ['socli/user_agents.txt'])],
     entry_points = {"console_scripts": ['socli = socli.socli:main']},
-    install_requires=['BeautifulSoup4','requests','colorama','Py-stackExchange', 'urwid'],
-    requires=['BeautifulSoup4','requests','colorama','PyStackExchange', 'urwid'],
+    install_requires=['BeautifulSoup4','requests','colorama', 'urwid'],
+    requires=['BeautifulSoup4','requests','colorama', 'urwid'],
+    extras_require={'lxml': ['lxml']},  # Faster page parsing
     version='3.6',
     url='http://www.github.com/gautamkrishnar/socli',
     keywords="stack overflow cli",
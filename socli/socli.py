@@ -5,28 +5,27 @@
 # And open source contributors at GitHub: https://github.com/gautamkrishnar/socli#contributors
 """
 
+# Modules which take long to import (requests, urwid, bs4, colorama) are only imported
+# by the code paths which use them, so that simple commands like --help start fast.
 import argparse
+import array
+import errno
+import importlib
 import os
 import sys
-import urllib
-import colorama
-import requests
-import urwid
-from bs4 import BeautifulSoup
 import random
 import re
+import signal
+import sqlite3
 import textwrap
-import subprocess
-import textwrap
+import threading
+import time
+from collections import OrderedDict
 
 try:
     import simplejson as json
 except ImportError:
     import json
-try:
-    JSONDecodeError = json.JSONDecodeError
-except AttributeError:
-    JSONDecodeError = ValueError
 
 
 # Global vars:
@@ -34,40 +33,88 @@ DEBUG = False  # Set True for enabling debugging
 soqurl = "http://stackoverflow.com/search?q="  # Query url
 sourl = "http://stackoverflow.com"  # Site url
 tag = ""  # tag based search
-app_data = dict()  # Data file dictionary
-data_file = os.path.join(os.path.dirname(__file__), "data.json")  # Data file location
+manual = 0  # 1 when user IDs were given on the command line
+history_size = 1000  # Queries kept in the history, the least recently used ones are forgotten first
+app_data = dict()  # Saved state (API key, user ID...), loaded by load_datafile()
+data_dir = os.path.join(os.environ.get("XDG_DATA_HOME") or os.environ.get("APPDATA") or
+                        os.path.join(os.path.expanduser("~"), ".local", "share"), "socli")  # Per user data directory
+cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA") or
+                         os.path.join(os.path.expanduser("~"), ".cache"), "socli")  # Per user cache directory
+data_file = os.path.join(data_dir, "state.db")  # State store location
+legacy_data_file = os.path.join(os.path.dirname(__file__), "data.json")  # Where older versions saved the state
+cache_file = os.path.join(cache_dir, "cache.db")  # Response cache location
+cache_ttl = 24 * 60 * 60  # Seconds a cached search or question stays fresh
+cache_max_size = 16 * 1024 * 1024  # Bytes of cached data kept before least recently used entries are evicted
+CACHE_VERSION = 3  # Bump whenever the layout of cached values changes
+question_memory = OrderedDict()  # Questions opened in this session by normalized URL, least recently used first
+question_memory_size = 32  # Questions kept in question_memory
+question_memory_chars = 8 * 1024 * 1024  # Characters of question and answer text kept in question_memory
+question_memory_used = 0  # Characters of text currently in question_memory
+question_memory_lock = threading.Lock()
+question_loads = dict()  # Locks held while a question is being loaded, by normalized URL
 query = ""  # Query
-uas = []  # User agent list
-header = {}  # Request header
+results_per_page = 15  # Questions asked from the search engine at a time in interactive mode, a full Stack Overflow page
+ua_buffer = b""  # Contents of user_agents.txt, loaded by loaduseragents() on first use
+ua_offsets = None  # array of the offsets at which each user agent starts in ua_buffer
+host_agents = dict()  # User agent sent to each host, so that a host keeps seeing the same browser
+host_agents_lock = threading.Lock()
+session = None  # Shared HTTP session, created on first use by get_session()
+connect_timeout = 5  # Seconds to wait for a connection to a server
+read_timeout = 15  # Seconds to wait for a server to send data
+max_retries = 3  # Retries for failed connections and throttled (429) or 5xx responses
+retry_backoff = 0.5  # Exponential backoff factor in seconds between retries
+max_per_host = 4  # Concurrent requests allowed to a single host
+rate_limits = {"google.com": (0.5, 4), "stackoverflow.com": (2.0, 10),
+               "api.stackexchange.com": (10.0, 30)}  # Requests per second and burst size allowed by host, shared by all socli processes
+default_rate_limit = (2.0, 10)  # Rate limit of hosts which are not in rate_limits
+host_slots = dict()  # Semaphores enforcing max_per_host, by host
+host_slots_lock = threading.Lock()
+batch_workers = 8  # Queries resolved concurrently in batch mode
+offline = False # Answers queries from the local index built by --import-dump instead of the network
+index_file = os.path.join(data_dir, "index.db")  # Offline index location
+api_search = False # Uses the Stack Exchange API to search and load questions
+se_api_url = "https://api.stackexchange.com/2.2"  # Stack Exchange API endpoint
+api_quota_remaining = None  # Requests left in today's API quota, None until it is known in any socli process
 google_search = True # Uses google search. Enabled by default.
 google_search_url = "https://www.google.com/search?q=site:stackoverflow.com+" #Google search query URL
-question_post = None #Used to see whether we are currently displaying a question post
-question_page = None #Not None only if in interactive mode. Displays all the questions found.
-header_for_display = None #Used as header to display question post
-LOOP = None #Main Loop used to render widgets
-
-#Palette for question post colors
-palette = [('answer', 'default', 'default'),
-           ('title', 'light green, bold', 'default'),
-           ('heading', 'light green, bold', 'default'),
-           ('metadata', 'dark green', 'default'),
-           ('less-important', 'dark gray', 'default'),
-           ('warning', 'yellow', 'default')
-           ]
-
-# Suppressing InsecureRequestWarning and many others
-requests.packages.urllib3.disable_warnings()
+federated_search = False # Searches Google and Stack Overflow at the same time and uses the first results
+engine_cooldown = 60 * 60 # Seconds a search engine which served a captcha is skipped by federated search
+federated_engines = dict() # Engine which answered first for each query, used alone for the next pages of the query
+output_format = None #text, json or markdown to print results instead of displaying them with urwid
+html_parser = None #BeautifulSoup tree builder, lxml if it is installed. Picked by make_soup() on first use.
+terminal_size = None #(columns, lines) of the terminal, cached by get_terminal_size() until the window is resized
+previous_sigwinch_handler = None #SIGWINCH handler replaced by invalidate_terminal_size(), urwid's while it runs
+
+class LazyModule(object):
+    """
+    Stands in for a module which is imported the first time one of its attributes is used.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+requests = LazyModule("requests")
+colorama = LazyModule("colorama")
 
 ### To support python 2:
 if sys.version < '3.0.0':
     global FileNotFoundError
     FileNotFoundError = IOError
+    import urllib
 
 
     def urlencode(inp):
         return urllib.quote_plus(inp)
 
 
+    def urldecode(inp):
+        return urllib.unquote_plus(inp)
+
+
     def dispstr(inp):
         return inp.encode('utf-8')
 
@@ -77,10 +124,16 @@ if sys.version < '3.0.0':
         tempx = raw_input()
         return tempx
 else:
+    import urllib.parse
+
     def urlencode(inp):
         return urllib.parse.quote_plus(inp)
 
 
+    def urldecode(inp):
+        return urllib.parse.unquote_plus(inp)
+
+
     def dispstr(inp):
         return inp
 
@@ -109,237 +162,6 @@ class bcolors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-class UnicodeText(urwid.Text):
-    """ encode all text to utf-8 """
-
-    def __init__(self, text):
-        # As we were encoding all text to utf-8 in output before with dispstr, do it automatically for all input
-        text = UnicodeText.to_unicode(text)
-        urwid.Text.__init__(self, text)
-
-    @classmethod
-    def to_unicode(cls, markup):
-        """convert urwid text markup object to utf-8"""
-        try:
-            return dispstr(markup)
-        except AttributeError:
-            mapped = [cls.to_unicode(i) for i in markup]
-            if isinstance(markup, tuple):
-                return tuple(mapped)
-            else:
-                return mapped
-
-class Header(UnicodeText):
-    """
-    Header of the question page. Event messages are recorded here.
-    """
-
-    def __init__(self):
-        self.current_event = None
-        UnicodeText.__init__(self, '')
-
-    def event(self, event, message):
-        self.current_event = event
-        self.set_text(message)
-
-    def clear(self, event):
-        if self.current_event == event:
-            self.set_text('')
-
-class EditedMainLoop(urwid.MainLoop):
-
-    def process_input(self, keys):
-        super(EditedMainLoop, self).process_input(keys)
-        global question_post
-        if question_post != None:
-            if 'window resize' in keys:
-                question_post.keypress(question_post, 'window resize')
-
-class QuestionPage(urwid.WidgetWrap):
-    """
-    Main container for urwid interactive mode.
-    """
-
-    def __init__(self, data):
-        """
-        Construct the Question Page.
-        :param data: tuple of (answers, question_title, question_desc, question_stats, question_url)
-        """
-        answer_frame = self.makeFrame(data)
-        urwid.WidgetWrap.__init__(self, answer_frame)
-
-    def makeFrame(self, data):
-        """
-        Returns a new frame that is formatted correctly with respect to the window's dimensions.
-        :param data: tuple of (answers, question_title, question_desc, question_stats, question_url)
-        :return: a new urwid.Frame object
-        """
-        answers, question_title, question_desc, question_stats, question_url = data
-        self.data = data
-        self.question_desc = question_desc
-        self.url = question_url
-        self.answer_text = AnswerText(answers)
-        self.screenHeight, screenWidth = subprocess.check_output(['stty', 'size']).split()
-        self.question_text = urwid.BoxAdapter(QuestionDescription(question_desc), int(max(1, (int(self.screenHeight) - 9) / 2)))
-        answer_frame = urwid.Frame(
-            header= urwid.Pile( [
-                header_for_display,
-                QuestionTitle(question_title),
-                self.question_text,
-                QuestionStats(question_stats),
-                urwid.Divider('-')
-            ]),
-            body=self.answer_text,
-            footer= urwid.Pile([
-                QuestionURL(question_url),
-                UnicodeText(u'\u2191: previous answer, \u2193: next answer, o: open in browser, \u2190: back')
-            ])
-        )
-        return answer_frame
-
-    def keypress(self, size, key):
-        if key in {'down', 'n', 'N'}:
-            self.answer_text.next_ans()
-        elif key in {'up', 'b', 'B'}:
-            self.answer_text.prev_ans()
-        elif key in {'o', 'O'}:
-            import webbrowser
-            if sys.platform.startswith('darwin'):
-                browser = webbrowser.get('safari')
-            else:
-                browser = webbrowser.get()
-            print_warning("Opening in your browser...")
-            browser.open(self.url)
-        elif key == 'left':
-            global question_post
-            global question_page
-            question_post = None
-            if question_page is None:
-                sys.exit(0)
-            else:
-                LOOP.widget = question_page
-        elif key == 'window resize':
-            screenHeight, screenWidth = subprocess.check_output(['stty', 'size']).split()
-            if self.screenHeight != screenHeight:
-                self._invalidate()
-                answer_frame = self.makeFrame(self.data)
-                urwid.WidgetWrap.__init__(self, answer_frame)
-
-
-class AnswerText(urwid.WidgetWrap):
-    """Answers to the question.
-
-    Long answers can be navigated up or down using the mouse.
-    """
-
-    def __init__(self, answers):
-        urwid.WidgetWrap.__init__(self, UnicodeText(''))
-        self._selectable = True  # so that we receive keyboard input
-        self.answers = answers
-        self.index = 0
-        self.set_answer()
-
-    def set_answer(self):
-        """
-        We must use a box adapter to get the text to scroll when this widget is already in
-        a Pile from the main question page. Scrolling is necessary for long answers which are longer
-        than the length of the terminal.
-        """
-        self.content = [('less-important', 'Answer: ')] + self.answers[self.index].split("\n")
-        self._w = ScrollableTextBox(self.content)
-
-    def prev_ans(self):
-        """go to previous answer."""
-        self.index -= 1
-        if self.index < 0:
-            self.index = 0
-            header_for_display.event('answer-bounds', "No previous answers.")
-        else:
-            header_for_display.clear('answer-bounds')
-        self.set_answer()
-
-    def next_ans(self):
-        """go to next answer."""
-        self.index += 1
-        if self.index > len(self.answers) - 1:
-            self.index = len(self.answers) - 1
-            header_for_display.event('answer-bounds', "No more answers.")
-        else:
-            header_for_display.clear('answer-bounds')
-        self.set_answer()
-
-    def __len__(self):
-        """ return number of rows in this widget """
-        return len(self.content)
-
-class ScrollableTextBox(urwid.ListBox):
-    """ Display input text, scrolling through when there is not enough room.
-
-    Scrolling through text takes a little work to support on Urwid.
-    """
-
-    def __init__(self, content):
-        """
-        :param content: text string to be displayed
-        """
-        lines = [UnicodeText(line) for line in content]
-        body = urwid.SimpleFocusListWalker(lines)
-        urwid.ListBox.__init__(self, body)
-
-    def mouse_event(self, size, event, button, col, row, focus):
-        SCROLL_WHEEL_UP = 4
-        SCROLL_WHEEL_DOWN = 5
-        if button == SCROLL_WHEEL_DOWN:
-            self.keypress(size, 'down')
-        elif button == SCROLL_WHEEL_UP:
-            self.keypress(size, 'up')
-        else:
-            return False
-        return True
-
-class QuestionTitle(UnicodeText):
-    """ Title of the question,"""
-
-    def __init__(self, title):
-        text = ["Question: ", ('title', title), "\n"]
-        UnicodeText.__init__(self, text)
-
-#Must convert to BoxAdapter object if used as a flow widget.
-class QuestionDescription(urwid.WidgetWrap):
-    """ Description of the question """
-
-    def __init__(self, description):
-        urwid.WidgetWrap.__init__(self, UnicodeText(''))
-        self.description = description
-        self.set_description()
-
-    def set_description(self):
-        """
-        We must use a box adapter to get the text to scroll when this widget is already in
-        a Pile from the main question page. Scrolling is necessary for long questions which are longer
-        than the length of the terminal.
-        """
-        self.content =  self.description.strip("\n").split("\n")
-        self._w = ScrollableTextBox(self.content)
-
-    def __len__(self):
-        """ return number of rows in this widget """
-        return len(self.content)
-
-class QuestionStats(UnicodeText):
-    """ Stats of the question,"""
-
-    def __init__(self, stats):
-        text = ["\n", ('metadata', stats)]
-        UnicodeText.__init__(self, text)
-
-class QuestionURL(UnicodeText):
-    """ url of the question """
-
-    def __init__(self, url):
-        text = ["\n", ('heading', 'Question URL: '), url]
-        UnicodeText.__init__(self, text)
-
 def format_str(str, color):
     return "{0}{1}{2}".format(color, str, colorama.Style.RESET_ALL)
 
@@ -423,23 +245,80 @@ def socli(query):
     """
     query = urlencode(query)
     try:
-        if google_search:
-            questions = get_questions_for_query_google(query)
-            res_url = questions[0][2]  # Gets the first result
-            dispres(res_url)
-        else:
-            questions = get_questions_for_query(query)
-            res_url = questions[0][2]
-            dispres(sourl + res_url)  # Returned URL is relative to SO homepage
-    except UnicodeEncodeError as e:
+        questions = search_questions(query)
+        if not questions:
+            print_warning("No results found...")
+            sys.exit(0)
+        record_query(urldecode(query), questions[0].url)
+        dispres(questions[0].url)  # Gets the first result
+    except Exception as e:
+        report_search_error(e)
+
+
+def report_search_error(e):
+    """
+    Tells the user why a search or a question failed, from the except clause of every search command.
+    :param e: exception raised by the search
+    :return:
+    """
+    if isinstance(e, UnicodeEncodeError):
         showerror(e)
         print_warning("\n\nEncoding error: Use \"chcp 65001\" command before using socli...")
-        sys.exit(0)
-    except requests.exceptions.ConnectionError:
+    elif isinstance(e, requests.exceptions.ConnectionError):
         print_fail("Please check your internet connectivity...")
-    except Exception as e:
+    elif isinstance(e, requests.exceptions.Timeout):
+        print_fail("Stack Overflow took too long to respond. Please try again later...")
+    elif isinstance(e, APIError):
+        print_fail("Stack Exchange API error: " + str(e))
+    elif isinstance(e, CaptchaError):
+        print_warning(str(e))
+    else:
         showerror(e)
-        sys.exit(0)
+    sys.exit(0)
+
+
+def get_terminal_size():
+    """
+    Returns the size of the terminal without spawning a process.
+    The size is cached until the terminal is resized (SIGWINCH) or invalidate_terminal_size() is called.
+    Falls back to 80x24 when stdout is not a terminal.
+    :return: (columns, lines) tuple
+    """
+    global terminal_size
+    if terminal_size is None:
+        try:
+            import shutil
+            size = tuple(shutil.get_terminal_size((80, 24)))
+        except AttributeError:  # Python 2
+            try:
+                import fcntl
+                import struct
+                import termios
+                lines, columns = struct.unpack("hh", fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, b"\0" * 4))
+                size = (columns, lines) if columns and lines else (80, 24)
+            except Exception:
+                size = (80, 24)
+        terminal_size = size
+        if hasattr(signal, "SIGWINCH") and signal.getsignal(signal.SIGWINCH) != invalidate_terminal_size:
+            global previous_sigwinch_handler
+            try:
+                previous_sigwinch_handler = signal.signal(signal.SIGWINCH, invalidate_terminal_size)
+            except ValueError:
+                pass  # Signal handlers can only be set from the main thread
+    return terminal_size
+
+
+def invalidate_terminal_size(*args):
+    """
+    Forgets the cached terminal size, so that the next get_terminal_size() measures it again.
+    Installed as the SIGWINCH handler, and called by the interactive UI when urwid reports a resize.
+    The handler it replaced, if any, is still called.
+    :return:
+    """
+    global terminal_size
+    terminal_size = None
+    if args and callable(previous_sigwinch_handler):
+        previous_sigwinch_handler(*args)
 
 
 def helpman():
@@ -477,13 +356,44 @@ def helpman():
               " it will ask the user to enter a default username. Now the user can run the command without the argument." + \
               "\n    eg: " + make_warning(("socli -u")) + ": Prompts and saves your username. Now you can just run " + \
               make_warning(("socli -u")) + " to see " + \
-              "the stats.\n    " + make_warning(("socli -u 22656")) + ": Displays info about user ID 22656" + '\n' + \
+              "the stats.\n    " + make_warning(("socli -u 22656")) + ": Displays info about user ID 22656" + \
+              "\n    " + make_warning(("socli -u 22656 1144035")) + ": Displays info about several users" + '\n' + \
         " " + bold("--del or -d") + \
               " : Deletes the configuration file generated by " + make_warning(("socli -u")) + " command." + '\n' + \
         " " + bold("--api or -a") + \
               " : Sets a custom API key for socli" + '\n' + \
         " " + bold("--sosearch or -s") + \
-              " : SoCLI uses google search by default. Use this option to search Stack Overflow directly."
+              " : SoCLI uses google search by default. Use this option to search Stack Overflow directly." + '\n' + \
+        " " + bold("--apisearch") + \
+              " : Searches and loads questions with the Stack Exchange API instead of downloading web pages. " + \
+              "Uses the API key set by " + make_warning("socli --api") + " if there is one." + '\n' + \
+        " " + bold("--batch") + \
+              " : Reads one query per line from the given file, or from the standard input if it is " + \
+              make_warning("-") + ", and prints the best answer for each query as a line of JSON." + \
+              "\n    eg: " + make_warning("socli --batch errors.txt > answers.json") + '\n' + \
+        " " + bold("--offline") + \
+              " : Searches a local copy of Stack Overflow instead of the internet. Build it first with " + \
+              make_warning("socli --import-dump Posts.xml") + " from the Posts.xml file of a Stack Exchange data dump " + \
+              "(https://archive.org/details/stackexchange). Authors are named after the Users.xml file of the dump " + \
+              "if it is in the same directory." + \
+              "\n    eg: " + make_warning("socli --offline -iq python for loop") + '\n' + \
+        " " + bold("--format") + \
+              " : Prints the result as " + make_warning("text") + ", " + make_warning("json") + " or " + \
+              make_warning("markdown") + " instead of displaying it interactively. Text is used when the " + \
+              "output is not a terminal." + "\n    eg: " + make_warning("socli --format json -q for loop python") + '\n' + \
+        " " + bold("--federated") + \
+              " : Searches Google and Stack Overflow at the same time and uses the results of the first one to " + \
+              "answer. An engine showing a captcha is skipped for an hour." + \
+              "\n    eg: " + make_warning("socli --federated -iq for loop python") + '\n' + \
+        " " + bold("--history") + \
+              " : Lists your recent queries with the question you picked for each of them. Followed by the " + \
+              "beginning of a query, lists the past queries matching it." + \
+              "\n    eg: " + make_warning("socli --history for lo") + '\n' + \
+        " " + bold("--last") + \
+              " : Opens the question you picked the last time you searched the same query, without searching again." + \
+              "\n    eg: " + make_warning("socli --last for loop python") + '\n' + \
+        " " + bold("--timeout") + \
+              " : Seconds to wait for Stack Overflow or Google to respond before giving up. Defaults to 15 seconds."
 
     helpText = make_header("\n\n< Search Query >:") + '\n' + \
         "\nQuery to search on Stack Overflow" + '\n' + \
@@ -498,7 +408,7 @@ def helpman():
         "\n\nSoCLI is an open source project hosted on github. Don't forget to star it if you liked it.\nUse GitHub" + \
               " issues to report problems: " + underline("http://github.com/gautamkrishnar/socli")
 
-    screenHeight, screenWidth = subprocess.check_output(['stty', 'size']).split()
+    screenWidth, screenHeight = get_terminal_size()
     subsequent_indent = '    '
     optionsText = '\n'.join(['\n'.join(textwrap.wrap(line, width=int(screenWidth) - len(subsequent_indent),
                  break_long_words=False, replace_whitespace=False, subsequent_indent=subsequent_indent))
@@ -511,103 +421,996 @@ def helpman():
     print(helpText)
 
 
-def get_questions_for_query(query, count=10):
+def make_soup(html, parse_only=None):
+    """
+    Parses HTML with the fastest tree builder available: lxml if it is installed, html.parser otherwise.
+    :param html: HTML of a page
+    :param parse_only: SoupStrainer limiting the tree to the parts of the page which are used
+    :return: BeautifulSoup object
+    """
+    from bs4 import BeautifulSoup
+    global html_parser
+    if html_parser is None:
+        try:
+            import lxml
+            html_parser = 'lxml'
+        except ImportError:
+            html_parser = 'html.parser'
+    return BeautifulSoup(html, html_parser, parse_only=parse_only)
+
+
+def page_parts(tags, classes):
+    """
+    Builds a SoupStrainer matching tags with any of the given classes. Only these tags and
+    their children are built when parsing, sidebars, scripts and footers are skipped.
+    :param tags: tag name or list of tag names
+    :param classes: CSS classes to match
+    :return: SoupStrainer object
+    """
+    from bs4 import SoupStrainer
+    # The strainer sees the raw class attribute while parsing, so match single classes inside it.
+    return SoupStrainer(tags, class_=re.compile(r"(^|\s)(" + "|".join(map(re.escape, classes)) + r")(\s|$)"))
+
+
+# Arguments of page_parts() for each kind of page
+QUESTION_PAGE_CLASSES = {"question-hyperlink", "question", "answer", "question-stats"}
+QUESTION_PAGE_PARTS = (["a", "div"], QUESTION_PAGE_CLASSES)
+SO_SEARCH_PARTS = ("div", ["question-summary"])
+GOOGLE_SEARCH_PARTS = ("div", ["g"])
+
+
+def get_questions_for_query(query, count=10, page=1):
+    """
+    Fetch questions for a query using stackoverflow default search mechanism.
+    At most 10 questions are returned. (Can be altered by passing count)
+    :param query: User-entered query string
+    :param page: page of the search results, starting from 1
+    :return: list of SearchResult objects
+    """
+    search_url = soqurl + query + ("&page=" + str(page) if page > 1 else "")
+    questions = cache_get("search", search_url)
+    if questions is not None:
+        return [SearchResult.from_list(question) for question in questions[:count]]
+    questions = []
+    soup = make_soup(fetch_page(search_url), page_parts(*SO_SEARCH_PARTS))
+    tmp = (soup.find_all("div", class_="question-summary"))
+    if not tmp:
+        return []
+    tmp1 = (soup.find_all("div", class_="excerpt"))
+    i = 0
+    while (i < len(tmp)):
+        question_text = ' '.join((tmp[i].a.get_text()).split())
+        question_text = question_text.replace("Q: ", "")
+        question_desc = (tmp1[i].get_text()).replace("'\r\n", "")
+        question_desc = ' '.join(question_desc.split())
+        question_local_url = tmp[i].a.get("href")  # Relative to SO homepage
+        questions.append(SearchResult(question_text, question_desc, sourl + question_local_url))
+        i = i + 1
+    # Whole result page is cached, count only limits the output
+    cache_put("search", search_url, [question.to_list() for question in questions])
+    return questions[:count]
+
+
+def get_questions_for_query_google(query, count=10, page=1):
+    """
+    Fetch questions for a query using Google search.
+    At most 10 questions are returned. (Can be altered by passing count)
+    :param query: User-entered query string
+    :param page: page of the search results, starting from 1. Google shows 10 results per page.
+    :return: list of SearchResult objects
+    """
+    search_url = google_search_url + query + ("&start=" + str((page - 1) * 10) if page > 1 else "")
+    questions = cache_get("search", search_url)
+    if questions is not None:
+        return [SearchResult.from_list(question) for question in questions[:count]]
+    questions = []
+    soup = make_soup(fetch_page(search_url), page_parts(*GOOGLE_SEARCH_PARTS))
+    for result in soup.find_all("div", class_="g"):
+        try:
+            question_title = result.find("h3", class_="r").get_text()[:-17]
+            question_desc = result.find("span", class_="st").get_text()
+            if question_desc=="": # For avoiding instant answers
+                raise NameError #Explicit raising
+            question_url = result.find("a").get("href") #Retrieves the Stack Overflow link
+            question_url = fixGoogleURL(question_url)
+
+            if question_url is None:
+                continue
+
+            questions.append(SearchResult(question_title, question_desc, question_url))
+        except NameError:
+            continue
+        except AttributeError:
+            continue
+
+    #Check if there are any valid question posts
+    if not questions:
+        return []
+    cache_put("search", search_url, [question.to_list() for question in questions])
+    return questions[:count]
+
+
+def search_questions(query, count=10, page=1):
+    """
+    Searches questions with the selected search engine: the offline index, the Stack Exchange API,
+    Google or Stack Overflow.
+    :param query: URL encoded query string
+    :param count: maximum number of questions returned
+    :param page: page of the search results, starting from 1. Pages of the offline index and the API
+                 hold count questions, Google and Stack Overflow pages hold what the site shows on one page.
+    :return: list of SearchResult objects, empty if nothing was found
+    """
+    if offline:
+        return get_questions_for_query_offline(query, count, page)
+    if api_search:
+        return get_questions_for_query_api(query, count, page)
+    if google_search and federated_search:
+        return get_questions_for_query_federated(query, count, page)
+    if google_search:
+        return search_engine("google", get_questions_for_query_google, query, count, page)
+    return search_engine("stackoverflow", get_questions_for_query, query, count, page)
+
+
+def search_engine(name, function, query, count, page):
+    """
+    Searches with one search engine, remembering that it is blocked if it serves a captcha.
+    :param name: name of the engine, "google" or "stackoverflow"
+    :param function: search function of the engine
+    :return: list of SearchResult objects
+    """
+    try:
+        return function(query, count, page)
+    except CaptchaError:
+        block_engine(name)
+        raise
+
+
+def get_questions_for_query_federated(query, count=10, page=1):
+    """
+    Searches Google and Stack Overflow concurrently and returns the results of the first one to find questions,
+    without waiting for the other. Engines which served a captcha in the last engine_cooldown seconds are
+    skipped, unless both of them did. The next pages of the query are only searched with the engine which
+    answered first, as the engines neither rank nor split their results into pages the same way.
+    :param query: URL encoded query string
+    :param count: maximum number of questions returned
+    :param page: page of the search results, starting from 1
+    :return: list of SearchResult objects
+    """
+    from multiprocessing.pool import ThreadPool
+    try:
+        import queue
+    except ImportError:
+        import Queue as queue  # Python 2
+    engines = [("google", get_questions_for_query_google), ("stackoverflow", get_questions_for_query)]
+    if page > 1 and query in federated_engines:
+        name = federated_engines[query]
+        return search_engine(name, dict(engines)[name], query, count, page)
+    engines = [engine for engine in engines if not engine_blocked(engine[0])] or engines
+    results = queue.Queue()
+
+    def run(name, function):
+        try:
+            results.put((name, search_engine(name, function, query, count, page), None))
+        except Exception as e:
+            results.put((name, None, e))
+
+    pool = ThreadPool(len(engines))
+    for name, function in engines:
+        pool.apply_async(run, (name, function))
+    pool.close()  # The slower search is not waited for, it is abandoned if socli exits first
+    error = None
+    for _ in engines:
+        name, questions, e = results.get()
+        if questions:
+            federated_engines[query] = name
+            return questions
+        error = error or e
+    if error is not None:
+        raise error
+    return []
+
+
+def engine_blocked(name):
+    """
+    Tells if a search engine served a captcha less than engine_cooldown seconds ago, in this or another run.
+    :param name: name of the engine
+    :return: True if the engine should not be used for now
+    """
+    try:
+        conn = open_datafile()
+        try:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", ("blocked:" + name,)).fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        return False
+    return row is not None and json.loads(row[0]) > time.time()
+
+
+def block_engine(name):
+    """
+    Remembers that a search engine served a captcha, so that federated search skips it for engine_cooldown seconds.
+    :param name: name of the engine
+    :return:
+    """
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                             ("blocked:" + name, json.dumps(time.time() + engine_cooldown)))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+
+
+def open_index():
+    """
+    Opens the offline index built by --import-dump. Exits if it doesn't exist yet.
+    :return: sqlite3 connection
+    """
+    if not os.path.exists(index_file):
+        print_warning("Offline index not found. Build it from a Stack Overflow data dump first: "
+                      "socli --import-dump Posts.xml")
+        sys.exit(1)
+    return sqlite3.connect(index_file)
+
+
+def strip_html(html):
+    """
+    Cheap conversion of post HTML to plain text for the full text index.
+    :param html: HTML of a post
+    :return: text without tags
+    """
+    return ' '.join(re.sub(r"<[^>]*>", " ", html).split())
+
+
+def html_text(html):
+    """
+    Converts the HTML of a post to the text which is displayed, like the posts of fetched pages.
+    :param html: HTML of a post
+    :return: text of the post
+    """
+    soup = make_soup(html)
+    add_urls(soup)
+    return soup.get_text()
+
+
+def import_dump(path):
+    """
+    Builds the offline index from the Posts.xml file of a Stack Exchange data dump.
+    The dump is parsed as a stream, so memory use does not depend on its size.
+    The index is built next to the old one and replaces it once complete.
+    Authors are named after the Users.xml file of the dump when it is next to Posts.xml.
+    :param path: path of Posts.xml
+    :return:
+    """
+    make_dir(os.path.dirname(index_file))
+    tmp_file = index_file + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    conn.execute("PRAGMA synchronous = OFF")  # The index is rebuilt from scratch if importing fails
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE questions (id INTEGER PRIMARY KEY, title TEXT, tags TEXT, body TEXT, "
+                 "score INTEGER, views INTEGER, answer_count INTEGER, created TEXT, accepted_answer INTEGER)")
+    conn.execute("CREATE TABLE answers (id INTEGER PRIMARY KEY, question INTEGER, body TEXT, score INTEGER, "
+                 "accepted INTEGER, author TEXT)")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE questions_fts USING fts5(title, tags, body)")
+        conn.execute("INSERT INTO meta VALUES ('fts', '5')")
+    except sqlite3.OperationalError:
+        conn.execute("CREATE VIRTUAL TABLE questions_fts USING fts4(title, tags, body)")  # Older SQLite builds
+        conn.execute("INSERT INTO meta VALUES ('fts', '4')")
+    # Only deleted and anonymous users are named in Posts.xml, the others are identified by OwnerUserId
+    conn.execute("CREATE TEMP TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+    users_path = os.path.join(os.path.dirname(path), "Users.xml")
+    if os.path.exists(users_path):
+        users = []
+        for row in iter_dump_rows(users_path):
+            users.append((int(row.get("Id")), row.get("DisplayName")))
+            if len(users) >= 5000:
+                conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?)", users)
+                users = []
+        conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?)", users)
+    questions, answers = [], []
+    imported = 0
+    for row in iter_dump_rows(path):
+        post_type = row.get("PostTypeId")
+        if post_type == "1":
+            # Tags are stored as <python><list> in old dumps and |python|list| in new ones
+            tags = ' '.join(re.findall(r"[^<>|]+", row.get("Tags", "")))
+            questions.append((int(row.get("Id")), row.get("Title", ""), tags, row.get("Body", ""),
+                              int(row.get("Score", 0)), int(row.get("ViewCount", 0)),
+                              int(row.get("AnswerCount", 0)), row.get("CreationDate", ""),
+                              int(row.get("AcceptedAnswerId")) if row.get("AcceptedAnswerId") else None))
+        elif post_type == "2":
+            owner = int(row.get("OwnerUserId")) if row.get("OwnerUserId") else None
+            answers.append((int(row.get("Id")), int(row.get("ParentId")), row.get("Body", ""),
+                            int(row.get("Score", 0)), row.get("OwnerDisplayName"), owner, owner))
+        if len(questions) + len(answers) >= 5000:
+            imported += len(questions) + len(answers)
+            write_index_rows(conn, questions, answers)
+            questions, answers = [], []
+            sys.stdout.write("\rImported " + str(imported) + " posts...")
+            sys.stdout.flush()
+    imported += len(questions) + len(answers)
+    write_index_rows(conn, questions, answers)
+    with conn:
+        # Answers may come before their question in the dump, so they are only marked once all are written
+        conn.execute("UPDATE answers SET accepted = 1 WHERE id IN "
+                     "(SELECT accepted_answer FROM questions WHERE accepted_answer IS NOT NULL)")
+        conn.execute("CREATE INDEX answers_question ON answers (question)")
+    conn.close()
+    if os.path.exists(index_file):
+        os.remove(index_file)
+    os.rename(tmp_file, index_file)
+    print_green("\rImported " + str(imported) + " posts. Use socli --offline to search them.")
+
+
+def write_index_rows(conn, questions, answers):
+    """
+    Writes a batch of parsed posts to the offline index.
+    :param conn: connection to the index
+    :param questions: list of question rows
+    :param answers: list of answer rows
+    :return:
+    """
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", questions)
+        conn.executemany("INSERT INTO questions_fts (rowid, title, tags, body) VALUES (?, ?, ?, ?)",
+                         [(q[0], q[1], q[2], strip_html(q[3])) for q in questions])
+        # Users missing from Users.xml are named like the site names users without a display name
+        conn.executemany("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, 0, "
+                         "COALESCE(?, (SELECT name FROM users WHERE id = ?), 'user' || ?))", answers)
+
+
+def iter_dump_rows(path):
+    """
+    Streams the rows of a Stack Exchange data dump file, only the current row is kept in memory.
+    :param path: path of an XML file of the dump, e.g. Posts.xml
+    :return: generator of row elements
+    """
+    try:
+        import xml.etree.cElementTree as ElementTree
+    except ImportError:
+        import xml.etree.ElementTree as ElementTree
+    context = ElementTree.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    for event, row in context:
+        if event == "end" and row.tag == "row":
+            yield row
+            root.clear()  # Drops the rows parsed so far
+
+
+def get_questions_for_query_offline(query, count=10, page=1):
+    """
+    Fetch questions for a query from the offline index, restricted to the tags given with --tag.
+    :param query: URL encoded query string
+    :param count: maximum number of questions returned
+    :param page: page of count questions, starting from 1
+    :return: list of SearchResult objects
+    """
+    words = ['"' + word + '"' for word in re.findall(r"\w+", urldecode(query), re.UNICODE)]
+    tags = ['tags:"' + name.strip() + '"' for tags in tag for name in tags.split(",") if name.strip()]
+    conn = open_index()
+    try:
+        fts = conn.execute("SELECT value FROM meta WHERE key = 'fts'").fetchone()[0]
+        order = "bm25(questions_fts, 10.0, 5.0, 1.0)" if fts == "5" else "questions.score DESC"
+        rows = []
+        # All words must match, fall back to any of them if nothing does
+        for operator in (" ", " OR "):
+            match = operator.join(words)
+            if tags:
+                match = ' AND '.join(tags) + (" AND (" + match + ")" if match else "")
+            if not match:
+                break
+            rows = conn.execute("SELECT questions.id, questions.title, questions.body FROM questions_fts "
+                                "JOIN questions ON questions.id = questions_fts.rowid "
+                                "WHERE questions_fts MATCH ? ORDER BY " + order + " LIMIT ? OFFSET ?",
+                                (match, count, (page - 1) * count)).fetchall()
+            if rows or len(words) < 2:
+                break
+    finally:
+        conn.close()
+    return [SearchResult(title, strip_html(body)[:200], sourl + "/questions/" + str(question_id))
+            for question_id, title, body in rows]
+
+
+def get_question_offline(url):
+    """
+    Loads a question and its answers from the offline index.
+    :param url: URL of the question
+    :return: Question object
+    """
+    conn = open_index()
+    try:
+        question = question_id(url)
+        if question is None and answer_id(url) is not None:
+            answer = conn.execute("SELECT question FROM answers WHERE id = ?", (answer_id(url),)).fetchone()
+            question = answer[0] if answer else None
+        row = conn.execute("SELECT title, body, score, views, answer_count, created FROM questions WHERE id = ?",
+                           (question,)).fetchone()
+        if row is None:
+            raise ValueError("Question not found in the offline index: " + url)
+        answers = conn.execute("SELECT body, score, accepted, author FROM answers WHERE question = ? "
+                               "ORDER BY accepted DESC, score DESC", (question,)).fetchall()
+    finally:
+        conn.close()
+    title, body, score, views, answer_count, created = row
+    stats = "Votes {0} | asked {1} | viewed {2} times | {3} answers".format(score, created[:10], views,
+                                                                           answer_count)
+    return Question(url, title, html_text(body), stats,
+                    [Answer(html_text(text), votes, bool(accepted), author) for text, votes, accepted, author in answers])
+
+
+class APIError(Exception):
+    """ Error returned by the Stack Exchange API, formatted as "400 [bad_parameter]: message" """
+
+
+def question_id(url):
+    """
+    Extracts the question ID from a question URL.
+    :param url: URL of a question
+    :return: question ID as an integer, or None for other URLs, e.g. the /a/ answer links found by Google
+    """
+    question = re.search(r"/(?:questions|q)/([0-9]+)", url)
+    return int(question.group(1)) if question else None
+
+
+def answer_id(url):
+    """
+    Extracts the answer ID from an answer link.
+    :param url: URL of an answer, e.g. https://stackoverflow.com/a/522578/1
+    :return: answer ID as an integer, or None if url is not an answer link
+    """
+    answer = re.search(r"/a/([0-9]+)", url)
+    return int(answer.group(1)) if answer else None
+
+
+def api_key():
+    """
+    Returns the API key saved with socli --api, or None if no key was saved.
+    """
+    if "api_key" not in app_data:
+        try:
+            load_datafile()
+        except (OSError, sqlite3.Error):
+            pass
+    return app_data.get("api_key")
+
+
+def se_api_get(path, **params):
+    """
+    Calls the Stack Exchange API on the stackoverflow site with the saved API key.
+    The backoff and quota fields of the responses are honored and shared with other socli processes:
+    calls wait until a requested backoff has passed and fail early once the quota is used up.
+    :param path: API method, e.g. "/search/advanced"
+    :param params: query parameters of the method
+    :return: decoded response wrapper, the results are in its "items" list
+    """
+    global api_quota_remaining
+    if api_quota_remaining is None:
+        api_quota_remaining = load_api_quota()
+    if api_quota_remaining == 0:
+        raise APIError("502 [throttle_violation]: API quota exhausted, it is reset at midnight UTC")
+    params["site"] = "stackoverflow"
+    if api_key():
+        params["key"] = api_key()
+    take_token(se_api_url)
+    with host_slot(se_api_url):
+        response = get_session().get(se_api_url + path, params=params,
+                                     timeout=(connect_timeout, read_timeout)).json()
+    if "error_id" in response:
+        raise APIError("{0} [{1}]: {2}".format(response["error_id"], response.get("error_name"),
+                                               response.get("error_message")))
+    if "backoff" in response:
+        delay_host(se_api_url, response["backoff"])
+    if "quota_remaining" in response:
+        api_quota_remaining = response["quota_remaining"]
+        save_api_quota(api_quota_remaining)
+    return response
+
+
+def load_api_quota():
+    """
+    Returns the API quota left today, as last reported to any socli process.
+    :return: number of requests, or None if it isn't known for today
+    """
+    try:
+        conn = open_datafile()
+        try:
+            row = conn.execute("SELECT value FROM state WHERE key = 'api_quota'").fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        return None
+    if row is None:
+        return None
+    remaining, day = json.loads(row[0])
+    return remaining if day == time.strftime("%Y-%m-%d", time.gmtime()) else None  # Quotas reset at midnight UTC
+
+
+def save_api_quota(remaining):
+    """
+    Shares the API quota left today with other socli processes.
+    :param remaining: quota_remaining field of the last API response
+    :return:
+    """
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('api_quota', ?)",
+                             (json.dumps([remaining, time.strftime("%Y-%m-%d", time.gmtime())]),))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+
+
+def get_questions_api(ids):
+    """
+    Loads questions and all their answers from the Stack Exchange API with one batched request
+    for the questions and one for their answers (more if there are over 100 answers).
+    Loaded questions are stored in the response cache.
+    :param ids: list of at most 100 question IDs
+    :return: list of Question objects in the order of ids
+    """
+    path = "/questions/" + ";".join(str(i) for i in ids)
+    items = se_api_get(path, filter="withbody", pagesize=100)["items"]
+    answers = dict((item["question_id"], []) for item in items)
+    page, has_more = 1, bool(items)
+    while has_more:
+        response = se_api_get(path + "/answers", filter="withbody", sort="votes", pagesize=100, page=page)
+        for item in response["items"]:
+            answers.setdefault(item["question_id"], []).append(
+                Answer(html_text(item["body"]), item["score"], item["is_accepted"],
+                       item.get("owner", {}).get("display_name")))
+        page, has_more = page + 1, response.get("has_more", False)
+    questions = dict()
+    for item in items:
+        question_answers = sorted(answers[item["question_id"]], key=lambda answer: not answer.accepted)
+        stats = "Votes {0} | asked {1} | viewed {2} times | {3} answers".format(
+            item["score"], time.strftime("%Y-%m-%d", time.gmtime(item["creation_date"])),
+            item["view_count"], item["answer_count"])
+        question = Question(item["link"], html_text(item["title"]), html_text(item["body"]), stats,
+                            question_answers)
+        cache_put("question", question.url, question.to_list())
+        questions[item["question_id"]] = question
+    if not questions:
+        raise APIError("404 [not_found]: no such question")
+    return [questions[i] for i in ids if i in questions]
+
+
+def get_questions_for_query_api(query, count=10, page=1):
+    """
+    Fetch questions for a query using the advanced search of the Stack Exchange API.
+    The found questions are loaded with their answers right away, in batched requests,
+    so that displaying any of them doesn't need another request.
+    :param query: URL encoded query string
+    :param count: maximum number of questions returned, at most 100
+    :param page: page of count questions, starting from 1
+    :return: list of SearchResult objects
+    """
+    pagesize = min(count, 100)
+    search_url = se_api_url + "/search/advanced?q=" + query + "&tagged=" + ";".join(tag) + \
+        "&pagesize=" + str(pagesize) + "&page=" + str(page)
+    questions = cache_get("search", search_url)
+    if questions is not None:
+        return [SearchResult.from_list(question) for question in questions[:count]]
+    params = dict(q=urldecode(query), order="desc", sort="relevance", pagesize=pagesize, page=page)
+    if tag:
+        params["tagged"] = ";".join(tag).replace(",", ";")
+    items = se_api_get("/search/advanced", **params)["items"]
+    if not items:
+        return []
+    questions = get_questions_api([item["question_id"] for item in items])
+    questions = [SearchResult(question.title, ' '.join(question.body.split())[:200], question.url)
+                 for question in questions]
+    cache_put("search", search_url, [question.to_list() for question in questions])
+    return questions
+
+
+def get_session():
+    """
+    Returns the shared HTTP session, creating it on first use.
+    Connections are kept alive and pooled per host, failed requests are retried with exponential backoff.
+    :return: requests.Session object
+    """
+    global session
+    if session is None:
+        try:
+            from requests.packages.urllib3.util.retry import Retry
+            # Read timeouts are raised at once instead of retried, so a slow server is given up on after --timeout seconds
+            retries = Retry(total=max_retries, read=False, backoff_factor=retry_backoff,
+                            status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        except ImportError:
+            retries = max_retries  # Old urllib3 versions only retry failed connections
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retries)
+        requests.packages.urllib3.disable_warnings()  # Suppressing InsecureRequestWarning and many others
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
+
+
+def url_host(url):
+    """
+    Returns the host part of url.
+    :param url: absolute or protocol relative URL
+    :return: host in lower case, empty if url has none
+    """
+    host = re.match(r"^(?:[a-z]+:)?//([^/?#]*)", url, re.I)
+    return host.group(1).lower() if host else ""
+
+
+def host_slot(url):
+    """
+    Returns the semaphore limiting concurrent requests to the host of url to max_per_host.
+    :param url: URL about to be requested
+    :return: threading.Semaphore object, to be used as a context manager around the request
+    """
+    host = url_host(url)
+    with host_slots_lock:
+        if host not in host_slots:
+            host_slots[host] = threading.Semaphore(max_per_host)
+        return host_slots[host]
+
+
+def fetch_page(url):
+    """
+    Downloads a page with the user agent picked for its host and checks it for captchas.
+    This is the only place where search and question pages are requested from the network.
+    :param url: URL of the page
+    :return: HTML of the page
+    """
+    header = {"User-Agent": useragent(url_host(url))}
+    take_token(url)
+    with host_slot(url):
+        res_page = get_session().get(url, headers=header, timeout=(connect_timeout, read_timeout))
+    if res_page.status_code == 429:  # Still throttled after the retries, slow down every socli process
+        retry_after = res_page.headers.get("Retry-After", "")
+        delay_host(url, int(retry_after) if retry_after.isdigit() else 60)
+    captchacheck(res_page.url)
+    return res_page.text
+
+
+def rate_limit_host(url):
+    """
+    Returns the host whose rate limit applies to url, www. prefixes are ignored.
+    :param url: URL about to be requested
+    :return: host name
+    """
+    host = url_host(url)
+    return host[4:] if host.startswith("www.") else host
+
+
+def take_token(url):
+    """
+    Waits until the rate limit of the host of url allows another request.
+    The limit is a token bucket kept in the state store (as the time at which the bucket is
+    expected to be full again), so parallel socli processes share it. Each call reserves its
+    slot before waiting, so callers waiting at the same time are spaced out instead of all
+    sending their requests once the bucket refills.
+    :param url: URL about to be requested
+    :return:
+    """
+    host = rate_limit_host(url)
+    rate, burst = rate_limits.get(host, default_rate_limit)
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")  # No other process may read the bucket until it is updated
+                row = conn.execute("SELECT tat FROM rate_limits WHERE host = ?", (host,)).fetchone()
+                now = time.time()
+                tat = max(row[0] if row else 0, now)
+                conn.execute("INSERT OR REPLACE INTO rate_limits (host, tat) VALUES (?, ?)", (host, tat + 1 / rate))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        return
+    wait = tat - (burst - 1) / rate - now
+    if wait > 0:
+        time.sleep(wait)
+
+
+def delay_host(url, seconds):
+    """
+    Makes every socli process wait before sending another request to the host of url.
+    :param url: URL of the throttled request
+    :param seconds: seconds to wait, as asked by the server
+    :return:
+    """
+    host = rate_limit_host(url)
+    rate, burst = rate_limits.get(host, default_rate_limit)
+    tat = time.time() + seconds + (burst - 1) / rate  # The next request may only be sent after seconds
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO rate_limits (host, tat) VALUES (?, 0)", (host,))
+                conn.execute("UPDATE rate_limits SET tat = MAX(tat, ?) WHERE host = ?", (tat, host))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+
+
+class SearchResult(object):
+    """ A question found by a search """
+    __slots__ = ("title", "desc", "url")
+
+    def __init__(self, title, desc, url):
+        """
+        :param title: title of the question
+        :param desc: excerpt of the question shown by the search engine
+        :param url: full URL of the question
+        """
+        self.title = title
+        self.desc = desc
+        self.url = url
+
+    def to_dict(self):
+        return {"title": self.title, "desc": self.desc, "url": self.url}
+
+    def to_list(self):
+        """Compact form used for caching, see from_list()"""
+        return [self.title, self.desc, self.url]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+
+class Answer(object):
+    """ An answer to a question """
+    __slots__ = ("body", "score", "accepted", "author")
+
+    def __init__(self, body, score=None, accepted=False, author=None):
+        """
+        :param body: text of the answer
+        :param score: votes of the answer, None if unknown
+        :param accepted: True if this is the accepted answer
+        :param author: display name of the author, None if unknown
+        """
+        self.body = body
+        self.score = score
+        self.accepted = accepted
+        self.author = author
+
+    def to_dict(self):
+        return {"body": self.body, "score": self.score, "accepted": self.accepted, "author": self.author}
+
+    def to_list(self):
+        """Compact form used for caching, see from_list()"""
+        return [self.body, self.score, self.accepted, self.author]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+
+class Question(object):
+    """ A question page: the question itself, its stats and its answers """
+    __slots__ = ("url", "title", "body", "stats", "answers")
+
+    def __init__(self, url, title, body, stats, answers):
+        """
+        :param url: URL of the question
+        :param title: title of the question
+        :param body: description of the question
+        :param stats: stats line, e.g. votes and view count
+        :param answers: list of Answer objects in page order
+        """
+        self.url = url
+        self.title = title
+        self.body = body
+        self.stats = stats
+        self.answers = answers
+
+    def to_dict(self):
+        return {"url": self.url, "title": self.title, "body": self.body, "stats": self.stats,
+                "answers": [answer.to_dict() for answer in self.answers]}
+
+    def to_list(self):
+        """Compact form used for caching, see from_list()"""
+        return [self.url, self.title, self.body, self.stats, [answer.to_list() for answer in self.answers]]
+
+    @classmethod
+    def from_list(cls, data):
+        url, title, body, stats, answers = data
+        return cls(url, title, body, stats, [Answer.from_list(answer) for answer in answers])
+
+
+def answer_heading(answer):
+    """
+    Heading displayed above an answer, e.g. "Accepted answer by Jon Skeet (12 votes)"
+    :param answer: Answer object
+    :return: heading string
+    """
+    heading = "Accepted answer" if answer.accepted else "Answer"
+    if answer.author:
+        heading += " by " + answer.author
+    if answer.score is not None:
+        heading += " ({0} votes)".format(answer.score)
+    return heading
+
+
+def iter_page_parts(node, classes):
+    """
+    Yields the tags below node which have one of the given classes, in document order.
+    Matching tags are not descended into, so the tree is walked only once.
+    :param node: BeautifulSoup tag
+    :param classes: set of CSS classes
+    """
+    from bs4.element import Tag
+    for child in node.children:
+        if isinstance(child, Tag):
+            if classes.intersection(child.get("class") or ()):
+                yield child
+            else:
+                for part in iter_page_parts(child, classes):
+                    yield part
+
+
+def post_author(post):
+    """
+    Extracts the display name of the author of a post. The last user card of a post belongs
+    to its author, the others to its editors.
+    :param post: tag of the post
+    :return: display name or None
+    """
+    cards = post.find_all("div", class_="user-details")
+    if not cards:
+        return None
+    link = cards[-1].find("a")
+    author = (link or cards[-1]).get_text()
+    return ' '.join(author.split()) or None
+
+
+def post_score_and_text(post):
     """
-    Fetch questions for a query using stackoverflow default search mechanism.
-    Returned question urls are relative to SO homepage.
-    At most 10 questions are returned. (Can be altered by passing count)
-    :param query: User-entered query string
-    :return: list of [ (question_text, question_description, question_url) ]
+    Extracts the votes and the text of a question or answer post.
+    :param post: tag of the post
+    :return: tuple of ( score, text )
     """
-    questions = []
-    randomheaders()
-    search_res = requests.get(soqurl + query, headers=header)
-    captchacheck(search_res.url)
-    soup = BeautifulSoup(search_res.text, 'html.parser')
+    score = post.find("span", class_="vote-count-post")
+    score = score.get_text().strip() if score is not None else None
     try:
-        soup.find_all("div", class_="question-summary")[0]  # For explicitly raising exception
-    except IndexError:
-        print_warning("No results found...")
-        sys.exit(0)
-    tmp = (soup.find_all("div", class_="question-summary"))
-    tmp1 = (soup.find_all("div", class_="excerpt"))
-    i = 0
-    while (i < len(tmp)):
-        if i == count: break  # limiting results
-        question_text = ' '.join((tmp[i].a.get_text()).split())
-        question_text = question_text.replace("Q: ", "")
-        question_desc = (tmp1[i].get_text()).replace("'\r\n", "")
-        question_desc = ' '.join(question_desc.split())
-        question_local_url = tmp[i].a.get("href")
-        questions.append((question_text, question_desc, question_local_url))
-        i = i + 1
-    return questions
+        score = int(score)
+    except (TypeError, ValueError):
+        pass
+    text = post.find("div", class_="post-text")
+    if text is None:
+        return score, ""
+    add_urls(text)
+    return score, text.get_text()
 
 
-def get_questions_for_query_google(query, count=10):
+def parse_question_page(html, url):
     """
-    Fetch questions for a query using Google search.
-    Returned question urls are URLS to SO homepage.
-    At most 10 questions are returned. (Can be altered by passing count)
-    :param query: User-entered query string
-    :return: list of [ (question_text, question_description, question_url) ]
+    Extracts the question and its answers from the HTML of a StackOverflow question page
+    in a single walk over the question header, posts and stats.
+    :param html: HTML of a StackOverflow question page
+    :param url: URL of the page
+    :return: Question object
     """
-    i = 0
-    questions = []
-    randomheaders()
-    search_results = requests.get(google_search_url + query, headers=header)
-    captchacheck(search_results.url)
-    soup = BeautifulSoup(search_results.text, 'html.parser')
-    try:
-        soup.find_all("div", class_="g")[0]  # For explicitly raising exception
-    except IndexError:
-        print_warning("No results found...")
-        sys.exit(0)
-    for result in soup.find_all("div", class_="g"):
-        if i == count:
-            break
-        try:
-            question_title = result.find("h3", class_="r").get_text()[:-17]
-            question_desc = result.find("span", class_="st").get_text()
-            if question_desc=="": # For avoiding instant answers
-                raise NameError #Explicit raising
-            question_url = result.find("a").get("href") #Retrieves the Stack Overflow link
-            question_url = fixGoogleURL(question_url)
-
-            if question_url is None:
-                i = i-1
-                continue
-
-            questions.append([question_title, question_desc, question_url])
-            i += 1
-        except NameError:
-            continue
-        except AttributeError:
-            continue
-
-    #Check if there are any valid question posts
-    if not questions:
-        print_warning("No results found...")
-        sys.exit(0)
-    return questions
+    soup = make_soup(html, page_parts(*QUESTION_PAGE_PARTS))
+    question_title, question_desc, question_score, question_stats = None, None, None, None
+    answers = []
+    for part in iter_page_parts(soup, QUESTION_PAGE_CLASSES):
+        classes = part.get("class")
+        if "question-hyperlink" in classes:
+            if question_title is None:  # Later ones link to related questions
+                question_title = part.get_text()
+        elif "question-stats" in classes:
+            question_stats = ((part.get_text()).replace("\n", " ")).replace("     ", " | ")
+        elif "answer" in classes:
+            score, text = post_score_and_text(part)
+            answers.append(Answer(text, score, "accepted-answer" in classes, post_author(part)))
+        elif question_desc is None:
+            question_score, question_desc = post_score_and_text(part)
+    if question_title is None or question_desc is None:
+        raise ValueError("Not a question page: " + url)
+    if question_stats is None:
+        question_stats = "Could not load statistics."
+    else:
+        question_stats = "Votes " + str(question_score) + " | " + question_stats
+    question_stats = ' '.join(question_stats.split())
+    return Question(url, question_title, question_desc, question_stats, answers)
 
 
 def get_question_stats_and_answer(url):
     """
     Fetch the content of a StackOverflow page for a particular question.
+    Questions opened earlier in the session are kept in memory, and a question requested
+    by several threads at once is only loaded once.
     :param url: full url of a StackOverflow question
-    :return: tuple of ( question_title, question_desc, question_stats, answers )
+    :return: Question object
     """
-    randomheaders()
-    res_page = requests.get(url, headers=header)
-    captchacheck(res_page.url)
-    soup = BeautifulSoup(res_page.text, 'html.parser')
-    question_title, question_desc, question_stats = get_stats(soup)
-    answers = [s.get_text() for s in soup.find_all("div", class_="post-text")][
-              1:]  # first post is question, discard it.
-    if len(answers) == 0:
-        answers.append('No answers for this question ...')
-    return question_title, question_desc, question_stats, answers
+    key = normalize_url(url)
+    question = recall_question(key)
+    if question is not None:
+        return question
+    with question_memory_lock:
+        loading = question_loads.setdefault(key, threading.Lock())
+    try:
+        with loading:
+            question = recall_question(key)  # Another thread may have loaded it meanwhile
+            if question is None:
+                question = load_question(url)
+                remember_question(key, question)
+    finally:
+        with question_memory_lock:
+            question_loads.pop(key, None)  # Also when loading failed, e.g. on a timeout
+    return question
+
+
+def recall_question(key):
+    """
+    Looks up a question opened earlier in this session.
+    :param key: normalized URL of the question
+    :return: Question object, or None if it is not in memory
+    """
+    with question_memory_lock:
+        entry = question_memory.pop(key, None)
+        if entry is None:
+            return None
+        question_memory[key] = entry  # Most recently used
+        return entry[0]
+
+
+def remember_question(key, question):
+    """
+    Keeps a question in memory, evicting the least recently used questions once
+    question_memory_size questions or question_memory_chars characters are exceeded.
+    :param key: normalized URL of the question
+    :param question: Question object
+    :return:
+    """
+    global question_memory_used
+    chars = len(question.title) + len(question.body) + sum(len(answer.body) for answer in question.answers)
+    with question_memory_lock:
+        old = question_memory.pop(key, None)
+        if old is not None:
+            question_memory_used -= old[1]
+        question_memory[key] = (question, chars)
+        question_memory_used += chars
+        while len(question_memory) > 1 and (len(question_memory) > question_memory_size
+                                            or question_memory_used > question_memory_chars):
+            old_key, old = question_memory.popitem(last=False)
+            question_memory_used -= old[1]
+
+
+def load_question(url):
+    """
+    Loads a question from the offline index, the response cache, the Stack Exchange API or Stack Overflow.
+    Parsed pages are served from the response cache while they are fresh.
+    :param url: full url of a StackOverflow question
+    :return: Question object
+    """
+    if offline:
+        return get_question_offline(url)
+    cached = cache_get("question", url)
+    if cached is not None:
+        return Question.from_list(cached)
+    if api_search:
+        question = question_id(url)
+        if question is None and answer_id(url) is not None:
+            answers = se_api_get("/answers/" + str(answer_id(url)))["items"]
+            question = answers[0]["question_id"] if answers else None
+        if question is not None:
+            return get_questions_api([question])[0]
+        # Not a question or answer link, the page is downloaded instead
+    question = parse_question_page(fetch_page(url), url)
+    cache_put("question", url, question.to_list())
+    return question
 
 
 def socli_interactive_windows(query):
@@ -617,55 +1420,48 @@ def socli_interactive_windows(query):
     :return:
     """
     try:
-        search_res = requests.get(soqurl + query)
-        captchacheck(search_res.url)
-        soup = BeautifulSoup(search_res.text, 'html.parser')
+        questions = search_questions(query)
         try:
-            soup.find_all("div", class_="question-summary")[0]  # For explictly raising exception
-            tmp = (soup.find_all("div", class_="question-summary"))
-            tmp1 = (soup.find_all("div", class_="excerpt"))
-            i = 0
-            question_local_url = []
+            questions[0]  # For explictly raising exception
+            i = len(questions)
             print(bold("\nSelect a question below:\n"))
-            while (i < len(tmp)):
-                if i == 10: break  # limiting results
-                question_text = ' '.join((tmp[i].a.get_text()).split())
-                question_text = question_text.replace("Q: ", "")
-                question_desc = (tmp1[i].get_text()).replace("'\r\n", "")
-                question_desc = ' '.join(question_desc.split())
-                print_warning(str(i + 1) + ". " + dispstr(question_text))
-                question_local_url.append(tmp[i].a.get("href"))
-                print("  " + dispstr(question_desc) + "\n")
-                i = i + 1
+            for index, question in enumerate(questions):
+                print_warning(str(index + 1) + ". " + dispstr(question.title))
+                print("  " + dispstr(question.desc) + "\n")
             try:
                 op = int(inputs("\nType the option no to continue or any other key to exit:"))
                 while 1:
                     if (op > 0) and (op <= i):
-                        dispres(sourl + question_local_url[op - 1])
-                        cnt = 1  # this is because the 1st post is the question itself
+                        question = get_question_stats_and_answer(questions[op - 1].url)
+                        record_query(urldecode(query), question.url)
+                        print_header("\nQuestion: " + dispstr(question.title))
+                        print(dispstr(question.body.strip("\n")))
+                        print_blue(dispstr(question.stats))
+                        if not question.answers:
+                            print_warning("\nNo answers for this question ...")
+                            sys.exit(0)
+                        cnt = 0  # index of the displayed answer
+                        print_green("\n\n" + answer_heading(question.answers[cnt]) + ":\n")
+                        print("-------\n" + dispstr(question.answers[cnt].body) + "\n-------\n")
                         while 1:
-                            global tmpsoup
                             qna = inputs(
                                 "Type " + bold("o") + " to open in browser, " + bold("n") + " to next answer, " + bold(
                                     "b") + " for previous answer or any other key to exit:")
                             if qna in ["n", "N"]:
-                                try:
-                                    answer = (tmpsoup.find_all("div", class_="post-text")[cnt + 1].get_text())
-                                    print_green("\n\nAnswer:\n")
-                                    print("-------\n" + answer + "\n-------\n")
-                                    cnt = cnt + 1
-                                except IndexError as e:
+                                if cnt + 1 >= len(question.answers):
                                     print_warning(" No more answers found for this question. Exiting...")
                                     sys.exit(0)
+                                cnt = cnt + 1
+                                print_green("\n\n" + answer_heading(question.answers[cnt]) + ":\n")
+                                print("-------\n" + dispstr(question.answers[cnt].body) + "\n-------\n")
                                 continue
                             elif qna in ["b", "B"]:
-                                if cnt == 1:
+                                if cnt == 0:
                                     print_warning(" You cant go further back. You are on the first answer!")
                                     continue
-                                answer = (tmpsoup.find_all("div", class_="post-text")[cnt - 1].get_text())
-                                print_green("\n\nAnswer:\n")
-                                print("-------\n" + answer + "\n-------\n")
                                 cnt = cnt - 1
+                                print_green("\n\n" + answer_heading(question.answers[cnt]) + ":\n")
+                                print("-------\n" + dispstr(question.answers[cnt].body) + "\n-------\n")
                                 continue
                             elif qna in ["o", "O"]:
                                 import webbrowser
@@ -674,7 +1470,7 @@ def socli_interactive_windows(query):
                                 else:
                                     browser = webbrowser.get()
                                 print_warning("Opening in your browser...")
-                                browser.open(sourl + question_local_url[op - 1])
+                                browser.open(question.url)
                             else:
                                 break
                         sys.exit(0)
@@ -687,15 +1483,8 @@ def socli_interactive_windows(query):
         except IndexError:
             print_warning("No results found...")
             sys.exit(0)
-
-    except UnicodeEncodeError:
-        print_warning("\n\nEncoding error: Use \"chcp 65001\" command before using socli...")
-        sys.exit(0)
-    except requests.exceptions.ConnectionError:
-        print_fail("Please check your internet connectivity...")
     except Exception as e:
-        showerror(e)
-        sys.exit(0)
+        report_search_error(e)
 
 
 def socli_interactive(query):
@@ -703,89 +1492,20 @@ def socli_interactive(query):
     Interactive mode
     :return:
     """
+    query = urlencode(query)
     if sys.platform == 'win32':
         return socli_interactive_windows(query)
 
-    class SelectQuestionPage(urwid.WidgetWrap):
-
-        def display_text(self, index, question):
-            question_text, question_desc, _ = question
-            text = [
-                ("warning", u"{}. {}\n".format(index, question_text)),
-                question_desc + "\n",
-            ]
-            return text
-
-        def __init__(self, questions):
-            self.questions = questions
-            self.cachedQuestions = [None for _ in range(10)]
-            widgets = [self.display_text(i, q) for i, q in enumerate(questions)]
-            self.questions_box = ScrollableTextBox(widgets)
-            self.header = UnicodeText(('less-important', 'Select a question below:\n'))
-            self.footerText = '0-' + str(len(self.questions) - 1) + ': select a question, any other key: exit.'
-            self.errorText = UnicodeText.to_unicode('Question numbers range from 0-' + 
-                                                    str(len(self.questions) - 1) + 
-                                                    ". Please select a valid question number.")
-            self.footer = UnicodeText(self.footerText)
-            self.footerText = UnicodeText.to_unicode(self.footerText)
-            frame = urwid.Frame(header=self.header,
-                                body=urwid.Filler(self.questions_box, height=('relative', 100), valign='top'),
-                                footer=self.footer)
-            urwid.WidgetWrap.__init__(self, frame)
-
-        # Override parent method
-        def selectable(self):
-            return True
-
-        def keypress(self, size, key):
-            if key in '0123456789':
-                try:
-                    question_url = self.questions[int(key)][2]
-                    self.footer.set_text(self.footerText)
-                    self.select_question(question_url, int(key))
-                except IndexError as e:
-                    self.footer.set_text(self.errorText)
-            elif key in {'down', 'up'}:
-                self.questions_box.keypress(size, key)
-            else:
-                raise urwid.ExitMainLoop()
-
-        def select_question(self, url, index):
-            global question_post
-            if self.cachedQuestions[index] != None:
-                question_post = self.cachedQuestions[index]
-                LOOP.widget = question_post
-            else:
-                if not google_search:
-                    url = sourl + url
-                question_title, question_desc, question_stats, answers = get_question_stats_and_answer(url)
-                question_post = QuestionPage((answers, question_title, question_desc, question_stats, url))
-                self.cachedQuestions[index] = question_post
-                LOOP.widget = question_post
-
-    global header_for_display
-    global question_page
-    global LOOP
-    header_for_display = Header()
-
     try:
-        if google_search:
-            questions = get_questions_for_query_google(query)
-        else:
-            questions = get_questions_for_query(query)
-        question_page = SelectQuestionPage(questions)
-        LOOP = EditedMainLoop(question_page, palette)
-        LOOP.run()
-
-    except UnicodeEncodeError:
-        print_warning("\n\nEncoding error: Use \"chcp 65001\" command before using socli...")
-        sys.exit(0)
-    except requests.exceptions.ConnectionError as e:
-        print_fail("Please check your internet connectivity...")
+        questions = search_questions(query, results_per_page)
+        if not questions:
+            print_warning("No results found...")
+            sys.exit(0)
+        record_query(urldecode(query))
+        from . import tui
+        tui.browse_questions(questions, query)
     except Exception as e:
-        showerror(e)
-        print("exiting...")
-        sys.exit(0)
+        report_search_error(e)
 
 
 def socl_manusearch(query, rn):
@@ -801,43 +1521,120 @@ def socl_manusearch(query, rn):
         sys.exit(0)
     query = urlencode(query)
     try:
-        randomheaders()
-        #Set count = 99 so you can choose question numbers higher than 10
-        count = 99
-        res_url = None
+        # Only the result pages up to the requested question are fetched
+        questions = []
+        page = 1
         try:
-            if google_search:
-                questions = get_questions_for_query_google(query, count)
-                res_url = questions[rn - 1][2]
-            else:
-                questions = get_questions_for_query(query, count)
-                res_url = sourl + questions[rn - 1][2]
-            dispres(res_url)
+            while len(questions) < rn:
+                found = search_questions(query, results_per_page, page)
+                if not found:
+                    break
+                questions += found
+                page += 1
+            record_query(urldecode(query), questions[rn - 1].url)
+            dispres(questions[rn - 1].url)
         except IndexError:
             print_warning("No results found...")
             sys.exit(1)
-    except UnicodeEncodeError:
-        print_warning("Encoding error: Use \"chcp 65001\" command before "
-                      "using socli...")
-        sys.exit(0)
-    except requests.exceptions.ConnectionError:
-        print_fail("Please check your internet connectivity...")
     except Exception as e:
+        report_search_error(e)
+
+
+def resolve_query(query):
+    """
+    Searches a query and loads the top answer of its first result, for batch mode.
+    Never raises, errors are reported in the returned record.
+    :param query: query string
+    :return: dictionary with the query, the question found and its top answer, or an error message
+    """
+    record = {"query": query}
+    try:
+        questions = search_questions(urlencode(query), 1)
+        if not questions:
+            record["error"] = "No results found"
+            return record
+        question = get_question_stats_and_answer(questions[0].url)
+        record["question"] = {"url": question.url, "title": question.title, "stats": question.stats}
+        record["answer"] = question.answers[0].to_dict() if question.answers else None
+    except (Exception, SystemExit) as e:  # SystemExit would stop the pool worker
         showerror(e)
+        record["error"] = str(e) or e.__class__.__name__
+    return record
+
+
+def socli_batch(path):
+    """
+    Batch mode: resolves one query per line of a file (or stdin if path is "-") concurrently
+    and prints one JSON object per query, in input order, as soon as it is ready.
+    :param path: path of the query file or "-"
+    :return:
+    """
+    queries_file = sys.stdin if path == "-" else open(path)
+    try:
+        queries = [line.strip() for line in queries_file if line.strip()]
+    finally:
+        if queries_file is not sys.stdin:
+            queries_file.close()
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(batch_workers)
+    try:
+        for record in pool.imap(resolve_query, queries):
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        # The reader went away, e.g. socli --batch queries.txt | head. Silence the flush at exit too.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
         sys.exit(0)
+    finally:
+        pool.terminate()
 
 
-def userpage(userid):
+def get_users_api(ids):
+    """
+    Loads the profiles of users with one batched request, then their question counts and top tags.
+    The requests for the different users and resources run concurrently, and question counts use the
+    "total" filter so that no question is downloaded.
+    :param ids: list of at most 100 user IDs
+    :return: list of API user objects in the order of ids, with their "question_count",
+             "unaccepted_count", "top_answer_tag" and "top_question_tag" added. Unknown IDs are left out.
+    """
+    from multiprocessing.pool import ThreadPool
+    items = se_api_get("/users/" + ";".join(str(i) for i in ids), pagesize=100)["items"]
+    users = dict((item["user_id"], item) for item in items)
+    jobs = []
+    for user_id in users:
+        path = "/users/" + str(user_id)
+        jobs += [(user_id, "question_count", path + "/questions", dict(filter="total")),
+                 (user_id, "unaccepted_count", path + "/questions/unaccepted", dict(filter="total")),
+                 (user_id, "top_answer_tag", path + "/top-answer-tags", dict(pagesize=1)),
+                 (user_id, "top_question_tag", path + "/top-question-tags", dict(pagesize=1))]
+    if jobs:
+        pool = ThreadPool(min(len(jobs), max_per_host))
+        try:
+            responses = pool.map(lambda job: se_api_get(job[2], **job[3]), jobs)
+        finally:
+            pool.close()
+        for (user_id, field, path, params), response in zip(jobs, responses):
+            if "total" in response:
+                users[user_id][field] = response["total"]
+            else:
+                users[user_id][field] = response["items"][0]["tag_name"] if response["items"] else None
+    return [users[i] for i in ids if i in users]
+
+
+def userpage(userids):
     """
     Stackoverflow user profile browsing
-    :param userid:
+    :param userids: list of user IDs
     :return:
     """
     global app_data
-    import stackexchange
+    global manual
 
     try:
-        userid = int(userid)
+        userids = [int(userid) for userid in userids]
     except ValueError as e:
         print_warning("\nUser ID must be an integer.")
         print(
@@ -845,43 +1642,58 @@ def userpage(userid):
         exit(1)
 
     try:
-        if "api_key" not in app_data:
-            app_data["api_key"] = None
-        userprofile = stackexchange.Site(stackexchange.StackOverflow, app_key=app_data["api_key"]).user(userid)
-        print(bold("\n User: " + userprofile.display_name.format()))
-        print("\n\tReputations: " + userprofile.reputation.format())
-        print_warning("\n\tBadges:")
-        print("\t\t   Gold: " + str(userprofile.gold_badges))
-        print("\t\t Silver: " + str(userprofile.silver_badges))
-        print("\t\t Bronze: " + str(userprofile.bronze_badges))
-        print("\t\t  Total: " + str(userprofile.badge_total))
-        print_warning("\n\tStats:")
-        total_questions = len(userprofile.questions.fetch())
-        unaccepted_questions = len(userprofile.unaccepted_questions.fetch())
-        accepted = total_questions - unaccepted_questions
-        rate = 0 if (total_questions==0) else ((accepted / float(total_questions)) * 100)
-        print("\t\t Total Questions Asked: " + str(len(userprofile.questions.fetch())))
-        print('\t\t        Accept rate is: %.2f%%.' % rate)
-        #check if the user have answers and questions or no. 
-        if userprofile.top_answer_tags.fetch():
-            print('\nMost experienced on %s.' % userprofile.top_answer_tags.fetch()[0].tag_name)
-        else:
-            print("You have 0 answers")
-        if userprofile.top_question_tags.fetch():
-            print('Most curious about %s.' % userprofile.top_question_tags.fetch()[0].tag_name)
-        else:
-            print("You have 0 questions")
-    except urllib.error.URLError:
+        users = []
+        for i in range(0, len(userids), 100):
+            users += get_users_api(userids[i:i + 100])
+        if not users:
+            if manual == 1:
+                print_warning("Wrong user ID specified...")
+                helpman()
+                exit(1)
+            print_warning("Wrong user ID... Deleting the data file...")
+            del_datafile()
+            exit(1)
+        found = set(user["user_id"] for user in users)
+        for userid in userids:
+            if userid not in found:
+                print_warning("\nUser ID {0} not found.".format(userid))
+        for user in users:
+            badges = user.get("badge_counts", {})
+            print(bold("\n User: " + html_text(user["display_name"])))
+            print("\n\tReputations: " + str(user["reputation"]))
+            print_warning("\n\tBadges:")
+            print("\t\t   Gold: " + str(badges.get("gold", 0)))
+            print("\t\t Silver: " + str(badges.get("silver", 0)))
+            print("\t\t Bronze: " + str(badges.get("bronze", 0)))
+            print("\t\t  Total: " + str(sum(badges.values())))
+            print_warning("\n\tStats:")
+            total_questions = user["question_count"]
+            accepted = total_questions - user["unaccepted_count"]
+            rate = 0 if (total_questions==0) else ((accepted / float(total_questions)) * 100)
+            print("\t\t Total Questions Asked: " + str(total_questions))
+            print('\t\t        Accept rate is: %.2f%%.' % rate)
+            #check if the user have answers and questions or no.
+            if user["top_answer_tag"]:
+                print('\nMost experienced on %s.' % user["top_answer_tag"])
+            else:
+                print("You have 0 answers")
+            if user["top_question_tag"]:
+                print('Most curious about %s.' % user["top_question_tag"])
+            else:
+                print("You have 0 questions")
+    except requests.exceptions.ConnectionError:
         print_fail("Please check your internet connectivity...")
         exit(1)
-    except Exception as e:
+    except requests.exceptions.Timeout:
+        print_fail("Stack Overflow took too long to respond. Please try again later...")
+        exit(1)
+    except APIError as e:
         showerror(e)
         if str(e) == "400 [bad_parameter]: `key` doesn't match a known application":
             print_warning("Wrong API key... Deleting the data file...")
             del_datafile()
             exit(1)
-        elif str(e) in ("not enough values to unpack (expected 1, got 0)", "400 [bad_parameter]: ids"):
-            global manual
+        elif str(e).startswith("400 [bad_parameter]: ids"):
             if manual == 1:
                 print_warning("Wrong user ID specified...")
                 helpman()
@@ -896,6 +1708,13 @@ def userpage(userid):
         print("Use http://stackapps.com/apps/oauth/register to register a new API key.")
         set_api_key()
         exit(1)
+    except Exception as e:
+        showerror(e)
+        print_warning(
+            "Stackoverflow exception. This might be caused due to the rate limiting: http://stackapps.com/questions/3055/is-there-a-limit-of-api-requests")
+        print("Use http://stackapps.com/apps/oauth/register to register a new API key.")
+        set_api_key()
+        exit(1)
 
 
 def set_api_key():
@@ -907,70 +1726,424 @@ def set_api_key():
     api_key = inputs("Type an API key to continue: ")
     if len(api_key) > 0:
         app_data["api_key"] = api_key
-        save_datafile()
+        if not save_datafile("api_key"):
+            return
     print_warning("\nAPI Key saved...")
 
 
-def save_datafile():
+def make_dir(path):
     """
-    Saves the app_data dictionary to a file named data_file
+    Creates a directory and its parents, if it doesn't exist yet.
+    :param path: directory path
     :return:
     """
-    # import json => Json imported globally
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def open_datafile():
+    """
+    Opens the state store, creating it when needed. The state saved in data.json by older versions is imported
+    when the store is created. The store is an SQLite database in WAL mode with one row per value, so
+    that concurrent socli processes can read it while another one saves a value, without ever rewriting it all.
+    :return: sqlite3 connection
+    """
+    make_dir(os.path.dirname(data_file))
+    created = not os.path.exists(data_file)
+    conn = sqlite3.connect(data_file, timeout=10)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS history (query TEXT PRIMARY KEY, url TEXT, "
+                         "uses INTEGER NOT NULL, first_used REAL NOT NULL, last_used REAL NOT NULL, "
+                         "grams INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_last_used ON history (last_used)")
+            # Trigrams of the queries in the history, to find queries close to a misspelled one
+            conn.execute("CREATE TABLE IF NOT EXISTS history_grams (gram TEXT NOT NULL, query TEXT NOT NULL, "
+                         "PRIMARY KEY (gram, query)) WITHOUT ROWID")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_grams_query ON history_grams (query)")
+            # Token buckets of the rate limiter, see take_token()
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (host TEXT PRIMARY KEY, tat REAL NOT NULL)")
+    except sqlite3.Error:
+        conn.close()  # Lets the caller delete a damaged file, Windows can't while it is open
+        raise
+    if created and os.path.exists(legacy_data_file):
+        try:
+            with open(legacy_data_file) as dataf:
+                legacy = json.load(dataf)
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO state (key, value) VALUES (?, ?)",
+                                 [(key, json.dumps(value)) for key, value in legacy.items()])
+        except (IOError, ValueError) as e:
+            showerror(e)
+    return conn
+
+
+def save_datafile(*keys):
+    """
+    Saves values of the app_data dictionary to the state store. Other saved values are left as they are.
+    :param keys: keys of the values to save, all of app_data if none is given
+    :return: True if the values were saved
+    """
     global app_data
-    global data_file
-    with open(data_file, "w") as dataf:
-        json.dump(app_data, dataf)
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                                 [(key, json.dumps(app_data[key])) for key in (keys or list(app_data))])
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        print_warning("Could not write to the data file. Use socli --delete if it is damaged.")
+        return False
+    return True
 
 
 def load_datafile():
     """
-    Loads the app_data dictionary form a file named data_file
+    Loads the app_data dictionary from the state store
     :return:
     """
-    # import json => Json imported globally
     global app_data
-    global data_file
-    with open(data_file) as dataf:
-        app_data = json.load(dataf)
+    conn = open_datafile()
+    try:
+        rows = conn.execute("SELECT key, value FROM state").fetchall()
+    finally:
+        conn.close()
+    app_data = dict()
+    for key, value in rows:
+        try:
+            app_data[key] = json.loads(value)
+        except ValueError as e:  # A damaged value is left out, the others are still usable
+            showerror(e)
 
 
-def del_datafile():
+def del_datafile(history=False):
     """
-    Deletes the data file
+    Deletes the saved state, e.g. a wrong user ID or API key
+    :param history: True to delete the query history too
     :return:
     """
     global data_file
-    try:
-        os.remove(data_file)
-    except FileNotFoundError:
+    global app_data
+    if not os.path.exists(data_file):
         print_warning("File not created.... Use socli -u to create a new configuration file.")
         exit(0)
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                conn.execute("DELETE FROM state")
+                if history:
+                    conn.execute("DELETE FROM history")
+                    conn.execute("DELETE FROM history_grams")
+        finally:
+            conn.close()
+    except sqlite3.OperationalError as e:  # e.g. locked by another socli process, the file is fine
+        showerror(e)
+        print_fail("The data file is in use, please try again.")
+        exit(1)
+    except sqlite3.DatabaseError:
+        remove_datafile()  # Damaged, nothing in it can be kept
+    app_data = dict()
+
+
+def remove_datafile():
+    """
+    Removes the state store with its write-ahead log, which SQLite would otherwise replay into a new store.
+    :return:
+    """
+    for path in (data_file, data_file + "-wal", data_file + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def normalize_query(query):
+    """
+    Normalizes a query so that queries only differing by case or spacing share one history entry.
+    :param query: query string
+    :return: normalized query
+    """
+    return ' '.join(query.lower().split())
+
+
+def record_query(query, url=None, new_use=True):
+    """
+    Records a query in the history, with the question picked for it if there is one.
+    Errors are only reported, the history must never stop a search.
+    :param query: query string, not URL encoded
+    :param url: URL of the question displayed for the query
+    :param new_use: False when another question is picked for a query already recorded in this run
+    :return:
+    """
+    query = normalize_query(query)
+    if not query:
+        return
+    now = time.time()
+    try:
+        conn = open_datafile()
+        try:
+            with conn:
+                updated = conn.execute("UPDATE history SET uses = uses + ?, last_used = ?, url = COALESCE(?, url) "
+                                       "WHERE query = ?", (1 if new_use else 0, now, url, query)).rowcount
+                if not updated:
+                    grams = trigrams(query)
+                    conn.execute("INSERT INTO history (query, url, uses, first_used, last_used, grams) "
+                                 "VALUES (?, ?, 1, ?, ?, ?)", (query, url, now, now, len(grams)))
+                    conn.executemany("INSERT INTO history_grams (gram, query) VALUES (?, ?)",
+                                     [(gram, query) for gram in grams])
+                    evicted = conn.execute("SELECT query FROM history ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+                                           (history_size,)).fetchall()
+                    conn.executemany("DELETE FROM history WHERE query = ?", evicted)
+                    conn.executemany("DELETE FROM history_grams WHERE query = ?", evicted)
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+
+
+def trigrams(query, end=True):
+    """
+    Returns the three character sequences of a normalized query, padded with spaces.
+    :param query: normalized query
+    :param end: False to leave out the padding at the end, for the beginning of a query
+    :return: set of trigrams
+    """
+    query = " " + query + (" " if end else "")
+    return set(query[i:i + 3] for i in range(len(query) - 2))
+
+
+def suggest_queries(text, count=10):
+    """
+    Suggests past queries beginning with text: queries starting with it first, the most used first, then
+    queries whose beginning shares most of the trigrams of text, so that a misspelled beginning still finds
+    them. Candidates are looked up in indexes, only the few sharing trigrams with text are scored.
+    :param text: beginning of a query, possibly misspelled
+    :param count: maximum number of suggestions
+    :return: list of (query, url, uses, last_used) tuples, url is None if no question was picked
+    """
+    text = normalize_query(text)
+    conn = open_datafile()
+    try:
+        # The range lets SQLite answer prefix searches from the primary key index
+        rows = conn.execute("SELECT query, url, uses, last_used FROM history WHERE query >= ? AND query < ? "
+                            "ORDER BY uses DESC, last_used DESC LIMIT ?", (text, text + u"\uffff", count)).fetchall()
+        candidates = []
+        if len(rows) < count and text:
+            grams = trigrams(text, end=False)
+            # Past queries containing at least half of the trigrams of text, anywhere
+            candidates = conn.execute("SELECT history.query, url, uses, last_used FROM history_grams "
+                                      "JOIN history ON history.query = history_grams.query "
+                                      "WHERE gram IN (" + ",".join("?" * len(grams)) + ") GROUP BY history.query "
+                                      "HAVING 2 * COUNT(*) >= ? ORDER BY COUNT(*) DESC, uses DESC LIMIT ?",
+                                      list(grams) + [len(grams), count * 10]).fetchall()
+    finally:
+        conn.close()
+    found = set(row[0] for row in rows)
+    scored = []
+    for row in candidates:
+        # Dice coefficient of the trigrams of text and of the beginning of the past query
+        beginning = trigrams(row[0][:len(text)], end=False)
+        score = 2.0 * len(grams & beginning) / (len(grams) + len(beginning))
+        if score >= 0.5 and row[0] not in found:
+            scored.append((score, row))
+    scored.sort(key=lambda item: (-item[0], -item[1][2], -item[1][3]))
+    return rows + [row for score, row in scored][:count - len(rows)]
+
+
+def last_result(query):
+    """
+    Returns the question picked the last time query was searched.
+    Only the same query (ignoring case and spacing) counts, a similar query may be about something else.
+    :param query: query string, not URL encoded
+    :return: URL of the question, or None if no question was picked for query
+    """
+    try:
+        conn = open_datafile()
+        try:
+            row = conn.execute("SELECT url FROM history WHERE query = ?", (normalize_query(query),)).fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        return None
+    return row[0] if row else None
+
+
+def show_history(prefix=""):
+    """
+    Prints the most recent queries, or the past queries matching prefix, with the question picked for them.
+    :param prefix: beginning of a query, lists the most recent queries if empty
+    :return:
+    """
+    try:
+        if prefix.strip():
+            rows = suggest_queries(prefix, 20)
+        else:
+            conn = open_datafile()
+            try:
+                rows = conn.execute("SELECT query, url, uses, last_used FROM history "
+                                    "ORDER BY last_used DESC LIMIT 20").fetchall()
+            finally:
+                conn.close()
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        print_fail("Could not read the history. Use socli --delete if the data file is damaged.")
+        return
+    if not rows:
+        print_warning("No queries found in the history...")
+        return
+    for query, url, uses, last_used in rows:
+        print(bold(query) + "  (" + str(uses) + (" times" if uses > 1 else " time") + ", last on " +
+              time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used)) + ")")
+        if url:
+            print("    " + url)
+
+
+def normalize_url(url):
+    """
+    Normalizes a question or search URL so that equivalent URLs share one cache entry.
+    Question URLs are reduced to their question ID, search URLs to a lower case host and query.
+    :param url: question or search URL
+    :return: normalized URL string
+    """
+    url = url.strip().split("#")[0]
+    question = re.search(r"stackoverflow\.com/(?:questions|q)/([0-9]+)", url)
+    if question:
+        return "stackoverflow.com/questions/" + question.group(1)
+    url = re.sub(r"^(https?:)?//(www\.)?", "", url.lower())
+    url = re.sub(r"(\+|%20)+", "+", url)  # Collapses repeated whitespace in encoded queries
+    return url.rstrip("/+")
+
+
+def open_cache():
+    """
+    Opens the response cache, creating it when needed.
+    :return: sqlite3 connection, or None if the cache can not be used (e.g. read-only home directory)
+    """
+    try:
+        make_dir(os.path.dirname(cache_file))
+        conn = sqlite3.connect(cache_file, timeout=5)
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                     "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        return conn
+    except (OSError, sqlite3.Error) as e:
+        showerror(e)
+        return None
+
+
+def cache_get(kind, url):
+    """
+    Looks up a cached search result or question page.
+    :param kind: "search" or "question"
+    :param url: URL the value was fetched from
+    :return: the cached value, or None on a miss or if the entry is older than cache_ttl
+    """
+    conn = open_cache()
+    if conn is None:
+        return None
+    key = "{0}:{1}:{2}".format(CACHE_VERSION, kind, normalize_url(url))
+    now = time.time()
+    try:
+        with conn:
+            row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > cache_ttl:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+    except (sqlite3.Error, ValueError) as e:
+        showerror(e)
+        return None
+    finally:
+        conn.close()
+
+
+def cache_put(kind, url, value):
+    """
+    Stores a parsed search result or question page in the cache, then evicts the least
+    recently used entries until the cache fits in cache_max_size.
+    :param kind: "search" or "question"
+    :param url: URL the value was fetched from
+    :param value: JSON serializable value
+    :return:
+    """
+    conn = open_cache()
+    if conn is None:
+        return
+    key = "{0}:{1}:{2}".format(CACHE_VERSION, kind, normalize_url(url))
+    value = json.dumps(value, separators=(",", ":"))
+    now = time.time()
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                         (key, value, len(value), now, now))
+            total = 0
+            evicted = []
+            for old_key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed DESC"):
+                total += size
+                if total > cache_max_size:
+                    evicted.append((old_key,))
+            conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+    except sqlite3.Error as e:
+        showerror(e)
+    finally:
+        conn.close()
 
 
 def loaduseragents():
     """
-    Loads the list of user agents from user_agents.txt
+    Loads user_agents.txt into a single buffer and indexes where each user agent starts in it,
+    so that picking one doesn't need a string for every line of the file.
     :return:
     """
-    global uas
-    uas = []
+    global ua_buffer, ua_offsets
     with open(os.path.join(os.path.dirname(__file__), "user_agents.txt"), 'rb') as uaf:
-        for ua in uaf.readlines():
-            if ua:
-                uas.append(ua.strip()[1:-1 - 1])
-    random.shuffle(uas)
+        buf = uaf.read()
+    offsets = array.array('L')
+    start = 0
+    while start < len(buf):
+        end = buf.find(b"\n", start)
+        end = len(buf) if end == -1 else end + 1
+        if buf[start:end].strip():
+            offsets.append(start)
+        start = end
+    offsets.append(len(buf))  # The last user agent ends at the end of the buffer
+    ua_buffer = buf
+    ua_offsets = offsets
+
+
+def randomuseragent():
+    """
+    Picks a random user agent without shuffling or copying the whole list.
+    :return: user agent string
+    """
+    if ua_offsets is None:
+        loaduseragents()
+    i = random.randrange(len(ua_offsets) - 1)
+    ua = ua_buffer[ua_offsets[i]:ua_offsets[i + 1]].strip()
+    return ua.strip(b'"').decode("utf-8", "replace")
 
 
-def randomheaders():
+def useragent(host):
     """
-    Sets header variable to a random value
-    :return:
+    Returns the user agent sent to host, picking a random one the first time the host is contacted.
+    Keeping it for the whole session makes requests to a host look like they come from a single browser.
+    :param host: host name, as returned by url_host()
+    :return: user agent string
     """
-    global uas
-    global header
-    ua = random.choice(uas)
-    header = {"User-Agent": ua}
+    with host_agents_lock:
+        if host not in host_agents:
+            host_agents[host] = randomuseragent()
+        return host_agents[host]
 
 
 def wrongsyn(query):
@@ -987,26 +2160,6 @@ def wrongsyn(query):
         return
 
 
-def get_stats(soup):
-    """
-    Get Question stats
-    :param soup:
-    :return:
-    """
-    question_title = (soup.find_all("a", class_="question-hyperlink")[0].get_text())
-    question_stats = (soup.find_all("span", class_="vote-count-post")[0].get_text())
-    try:
-        question_stats = "Votes " + question_stats + " | " + (((soup.find_all("div", class_="module question-stats")[0]
-                                                                .get_text()).replace("\n", " ")).replace("     "," | "))
-    except IndexError as e:
-        question_stats = "Could not load statistics."
-    question_desc = (soup.find_all("div", class_="post-text")[0])
-    add_urls(question_desc)
-    question_desc = question_desc.get_text()
-    question_stats = ' '.join(question_stats.split())
-    return question_title, question_desc, question_stats
-
-
 def add_urls(tags):
     """
     Adds the URL to any hyperlinked text found in a question
@@ -1037,18 +2190,59 @@ def dispres(url):
     :param url: URL of the search result
     :return:
     """
-    global question_post
-    global header_for_display
-    global LOOP
-    randomheaders()
-    res_page = requests.get(url, headers=header)
-    captchacheck(res_page.url)
-    header_for_display = Header()
-    question_title, question_desc, question_stats, answers = get_question_stats_and_answer(url)
-    question_post = QuestionPage((answers, question_title, question_desc, question_stats, url))
-    LOOP = EditedMainLoop(question_post, palette)
-    LOOP.run()
+    question = get_question_stats_and_answer(url)
+    if output_format is not None:
+        print_question(question, output_format)
+        return
+    from . import tui
+    tui.display_question(question)
+
+
+
+def format_question(question, fmt):
+    """
+    Formats a question and its answers for printing, one piece at a time.
+    :param question: Question object
+    :param fmt: "text", "json" (one JSON object per line) or "markdown"
+    :return: generator of strings, the question first and then each answer
+    """
+    if fmt == "json":
+        yield json.dumps({"type": "question", "url": question.url, "title": question.title,
+                          "body": question.body, "stats": question.stats}) + "\n"
+        for answer in question.answers:
+            record = answer.to_dict()
+            record["type"] = "answer"
+            yield json.dumps(record) + "\n"
+    elif fmt == "markdown":
+        yield "# {0}\n\n{1}\n\n*{2}*\n\n{3}\n".format(question.title, question.url, question.stats,
+                                                      question.body.strip("\n"))
+        for answer in question.answers:
+            yield "\n## {0}\n\n{1}\n".format(answer_heading(answer), answer.body.strip("\n"))
+    else:
+        yield "Question: {0}\n\n{1}\n\n{2}\n{3}\n".format(question.title, question.body.strip("\n"),
+                                                         question.stats, question.url)
+        for answer in question.answers:
+            yield "\n{0}:\n-------\n{1}\n-------\n".format(answer_heading(answer), answer.body.strip("\n"))
+
 
+def print_question(question, fmt):
+    """
+    Prints a question and its answers to stdout without starting urwid, flushing after each piece
+    so that a reader like head gets the question as soon as possible.
+    :param question: Question object
+    :param fmt: "text", "json" or "markdown"
+    :return:
+    """
+    try:
+        for piece in format_question(question, fmt):
+            sys.stdout.write(dispstr(piece))
+            sys.stdout.flush()
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        # The reader went away, e.g. socli ... | head. Silence the flush at exit too.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(0)
 
 
 def fixGoogleURL(url):
@@ -1079,25 +2273,25 @@ def fixGoogleURL(url):
     return url
 
 
+class CaptchaError(Exception):
+    """ Raised when Google or Stack Overflow redirect to a captcha check """
+
+
 def captchacheck(url):
     """
-    Exits program when their is a captcha. Prevents errors.
+    Raises CaptchaError when their is a captcha. Prevents errors.
     Users will have to manually verify their identity.
-    :param url: URL of stackoverflow
+    :param url: URL the request was redirected to
     :return:
     """
-    if google_search:
-        googleErrorDisplayMessage = "Google thinks you're a bot because you're issuing too many queries too quickly! " + \
-                                    "Now you'll have to wait about an hour before you're unblocked... :(. Use the -s tag " + \
-                                    "to search via Stack Overflow instead."
-        #Check if google detects user as a bot
-        if re.search("ipv4\.google\.com/sorry", url):
-            print_warning(googleErrorDisplayMessage)
-            exit(0)
-    else:
-        if re.search("\.com/nocaptcha", url): # Searching for stackoverflow captcha check
-            print_warning("StackOverflow captcha check triggered. Please wait a few seconds before trying again.")
-            exit(0)
+    googleErrorDisplayMessage = "Google thinks you're a bot because you're issuing too many queries too quickly! " + \
+                                "Now you'll have to wait about an hour before you're unblocked... :(. Use the -s tag " + \
+                                "to search via Stack Overflow instead."
+    #Check if google detects user as a bot
+    if re.search("ipv4\.google\.com/sorry", url):
+        raise CaptchaError(googleErrorDisplayMessage)
+    if re.search("\.com/nocaptcha", url): # Searching for stackoverflow captcha check
+        raise CaptchaError("StackOverflow captcha check triggered. Please wait a few seconds before trying again.")
 
 def retrieveSavedProfile():
     """
@@ -1115,9 +2309,9 @@ def retrieveSavedProfile():
             user = app_data["user"]
         else:
             raise FileNotFoundError  # Manually raising to get value
-    except JSONDecodeError:
-        # This maybe some write failures
-        del_datafile()
+    except sqlite3.DatabaseError:
+        # The file is damaged, e.g. by a disk failure
+        remove_datafile()
         print_warning("Error in parsing the data file, it will be now deleted. Please rerun the "
                       "socli -u command.")
         exit(1)
@@ -1126,9 +2320,9 @@ def retrieveSavedProfile():
         try:
             # Code to execute when first time user runs socli -u
             app_data['user'] = int(inputs("Enter your Stackoverflow User ID: "))
-            save_datafile()
             user = app_data['user']
-            print_green("\nUserID saved...\n")
+            if save_datafile('user'):
+                print_green("\nUserID saved...\n")
         except ValueError:
             print_warning("\nUser ID must be an integer.")
             print(
@@ -1156,13 +2350,17 @@ def parseArguments(command):
     parser.add_argument('--interactive', '-i', action='store_true', help=textwrap.dedent("To search in Stack Overflow and display the matching results. You can choose and browse any of the results interactively"))
     parser.add_argument('--debug', action='store_true', help="Turn debugging mode on")
     parser.add_argument('--sosearch', '-s', action='store_true', help="Searches directly on Stack Overflow instead of using Google")
+    parser.add_argument('--federated', action='store_true', help="Searches Google and Stack Overflow at the same time "
+                                                                 "and uses whichever answers first")
     parser.add_argument('--api', '-a', action='store_true', help="Sets a custom API key for socli")
     parser.add_argument('--delete', '-d', action='store_true', help="Deletes the configuration file generated by socli -u command")
+    parser.add_argument('--apisearch', action='store_true', help="Searches and loads questions with the Stack Exchange API")
+    parser.add_argument('--offline', action='store_true', help="Searches the local index built by --import-dump")
 
-    #Accepts 1 argument. Returns None if flag is not present and
-    #'STORED_USER' if flag is present, but no argument is supplied
-    parser.add_argument('--user', '-u', nargs='?', const='(RANDOM_STRING_CONSTANT)', type=str, help="Displays information about the user "
-                                                                            "provided as the next argument(optional). If no argument is provided "
+    #Accepts any number of arguments. Returns None if flag is not present and
+    #an empty list if flag is present, but no argument is supplied
+    parser.add_argument('--user', '-u', nargs='*', type=str, help="Displays information about the users "
+                                                                            "provided as the next arguments(optional). If no argument is provided "
                                                                             "it will ask the user to enter a default username. Now the user "
                                                                             "can run the command without the argument")
 
@@ -1179,6 +2377,17 @@ def parseArguments(command):
     parser.add_argument('userQuery', nargs='*', help=argparse.SUPPRESS)
 
     #Accepts 1 argument
+    parser.add_argument('--batch', metavar='FILE', help="Resolves one query per line of FILE (- for stdin) "
+                                                        "and prints the results as JSON lines")
+    parser.add_argument('--import-dump', metavar='POSTS_XML', help="Builds the offline index from the Posts.xml file "
+                                                                   "of a Stack Exchange data dump")
+    parser.add_argument('--format', choices=['text', 'json', 'markdown'], help="Prints the result in this format "
+                                                                             "instead of displaying it interactively")
+    parser.add_argument('--history', nargs='*', metavar='PREFIX', help="Lists the recent queries, or the past queries "
+                                                                        "matching PREFIX")
+    parser.add_argument('--last', action='store_true', help="Opens the result picked the last time the same query "
+                                                            "was searched, without searching again")
+    parser.add_argument('--timeout', type=float, help="Seconds to wait for Stack Overflow or Google to respond")
     parser.add_argument('--res', '-r', type=int, help="To select and display a result manually and display "
                                                   "its most voted answer. \n   eg:- socli --res 2 --query "
                                                   "foo bar: Displays the second search result of the query"
@@ -1195,7 +2404,6 @@ def main():
     global query
     global google_search
     namespace = parseArguments(sys.argv[1:])
-    loaduseragents() #Populates the user agents array
     query = ' '.join(namespace.query) + ' ' + ' '.join(namespace.userQuery)
     if namespace.help:
         helpman()
@@ -1213,19 +2421,42 @@ def main():
         sys.exit(0)
     if namespace.user != None: #If --user flag is present
         # Stackoverflow user profile support
-        user = None
-        if namespace.user != '(RANDOM_STRING_CONSTANT)': #If user provided a user ID
+        users = None
+        if namespace.user: #If user provided user IDs
             global manual  # Manual mode from command line
             manual = 1
-            user = namespace.user
+            users = namespace.user
         else: #If user did not provide a user id
-            user = retrieveSavedProfile()
-        userpage(user)
+            users = [retrieveSavedProfile()]
+        userpage(users)
+        sys.exit(0)
+    if namespace.history != None: #If --history flag is present
+        show_history(' '.join(namespace.history))
         sys.exit(0)
     if namespace.delete: #If --delete flag is present
-        del_datafile()
+        del_datafile(history=True)
         print_warning("Data files deleted...")
         sys.exit(0)
+    if namespace.import_dump != None: #If --import-dump flag is present
+        import_dump(namespace.import_dump)
+        sys.exit(0)
+    if namespace.apisearch: #If --apisearch flag is present
+        global api_search
+        api_search = True
+    if namespace.offline: #If --offline flag is present
+        global offline
+        offline = True
+    if namespace.format != None: #If --format flag is present
+        global output_format
+        output_format = namespace.format
+    elif not sys.stdout.isatty(): #Output is piped or redirected
+        output_format = "text"
+    if namespace.timeout != None: #If --timeout flag is present
+        global read_timeout
+        read_timeout = namespace.timeout
+    if namespace.federated: #If --federated flag is present
+        global federated_search
+        federated_search = True
     if namespace.sosearch: #If --sosearch flag is present
         google_search = False
     if namespace.tag: #If --tag flag is present
@@ -1233,6 +2464,20 @@ def main():
         google_search = False
         tag = namespace.tag
         hastags()
+    if namespace.last and query.strip(): #If --last flag is present
+        url = last_result(query)
+        if url is not None:
+            record_query(query, url)
+            try:
+                dispres(url)
+            except Exception as e:
+                report_search_error(e)
+            sys.exit(0)
+        if output_format is None: # Printed results must not be mixed with notices
+            print_warning("No result was picked for this query before, searching...")
+    if namespace.batch != None: #If --batch flag is present
+        socli_batch(namespace.batch)
+        sys.exit(0)
     if namespace.res != None: #If --res flag is present
         questionNumber = namespace.res
         if namespace.query != [] or namespace.tag != None: #There must either be a tag or a query
@@ -0,0 +1,657 @@
+"""
+# Stack overflow CLI
+# Interactive mode user interface, built with urwid.
+# Only imported when a question is displayed interactively, so that other commands start faster.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import urwid
+
+from .socli import answer_heading, dispstr, get_question_stats_and_answer, get_terminal_size, \
+    invalidate_terminal_size, normalize_url, print_warning, recall_question, record_query, \
+    results_per_page, search_questions, showerror, urldecode
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+
+# Global vars:
+question_post = None #Used to see whether we are currently displaying a question post
+question_page = None #Not None only if in interactive mode. Displays all the questions found.
+header_for_display = None #Used as header to display question post
+LOOP = None #Main Loop used to render widgets
+prefetch_workers = 4 #Worker threads used to load questions in the background in interactive mode
+line_cache_size = 256 #Line widgets kept by each LazyLineWalker, enough for a few screens of scrolling
+answer_cache_lines = 20000 #Lines of viewed answers kept by each AnswerText, with their scroll positions
+
+#Palette for question post colors
+palette = [('answer', 'default', 'default'),
+           ('title', 'light green, bold', 'default'),
+           ('heading', 'light green, bold', 'default'),
+           ('metadata', 'dark green', 'default'),
+           ('less-important', 'dark gray', 'default'),
+           ('warning', 'yellow', 'default'),
+           ('focus', 'standout', 'default')
+           ]
+
+class UnicodeText(urwid.Text):
+    """ encode all text to utf-8 """
+
+    def __init__(self, text):
+        # As we were encoding all text to utf-8 in output before with dispstr, do it automatically for all input
+        text = UnicodeText.to_unicode(text)
+        urwid.Text.__init__(self, text)
+
+    @classmethod
+    def to_unicode(cls, markup):
+        """convert urwid text markup object to utf-8"""
+        try:
+            return dispstr(markup)
+        except AttributeError:
+            mapped = [cls.to_unicode(i) for i in markup]
+            if isinstance(markup, tuple):
+                return tuple(mapped)
+            else:
+                return mapped
+
+class Header(UnicodeText):
+    """
+    Header of the question page. Event messages are recorded here.
+    """
+
+    def __init__(self):
+        self.current_event = None
+        UnicodeText.__init__(self, '')
+
+    def event(self, event, message):
+        self.current_event = event
+        self.set_text(message)
+
+    def clear(self, event):
+        if self.current_event == event:
+            self.set_text('')
+
+class BackgroundFetcher(object):
+    """
+    Runs blocking network and parsing jobs on worker threads and hands their results
+    back to the urwid main loop through a pipe, so that the UI never waits on them.
+    """
+
+    def __init__(self, loop, callback, workers=None):
+        """
+        :param loop: urwid main loop the results are delivered to
+        :param callback: called from the main loop as callback(key, result, error) once a job finishes
+        :param workers: number of worker threads, defaults to prefetch_workers
+        """
+        self.callback = callback
+        self.results = queue.Queue()
+        self.pool = ThreadPool(workers or prefetch_workers)
+        self.pipe = loop.watch_pipe(self.deliver)
+
+    def submit(self, key, function, *args):
+        """Runs function(*args) on a worker thread. key identifies the job in the callback."""
+        self.pool.apply_async(self.run, (key, function, args))
+
+    def run(self, key, function, args):
+        result, error = None, None
+        try:
+            result = function(*args)
+        except (Exception, SystemExit) as e:  # The main loop must hear back from every job
+            error = e
+        self.results.put((key, result, error))
+        os.write(self.pipe, b".")  # Wakes up the main loop
+
+    def deliver(self, data):
+        """Called by the main loop when workers have written to the pipe."""
+        while True:
+            try:
+                key, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.callback(key, result, error)
+        return True
+
+class EditedMainLoop(urwid.MainLoop):
+
+    def process_input(self, keys):
+        if 'window resize' in keys:
+            invalidate_terminal_size()  # urwid handles SIGWINCH itself while it runs
+        super(EditedMainLoop, self).process_input(keys)
+        global question_post
+        if question_post != None:
+            if 'window resize' in keys:
+                question_post.keypress(question_post, 'window resize')
+
+class QuestionPage(urwid.WidgetWrap):
+    """
+    Main container for urwid interactive mode.
+    """
+
+    def __init__(self, question):
+        """
+        Construct the Question Page.
+        :param question: Question object
+        """
+        answer_frame = self.makeFrame(question)
+        urwid.WidgetWrap.__init__(self, answer_frame)
+
+    def makeFrame(self, question):
+        """
+        Returns a new frame that is formatted correctly with respect to the window's dimensions.
+        :param question: Question object
+        :return: a new urwid.Frame object
+        """
+        self.question = question
+        self.url = question.url
+        self.answer_text = AnswerText(question.answers)
+        screenWidth, self.screenHeight = get_terminal_size()
+        self.question_text = urwid.BoxAdapter(QuestionDescription(question.body), self.description_height())
+        answer_frame = urwid.Frame(
+            header= urwid.Pile( [
+                header_for_display,
+                QuestionTitle(question.title),
+                self.question_text,
+                QuestionStats(question.stats),
+                urwid.Divider('-')
+            ]),
+            body=self.answer_text,
+            footer= urwid.Pile([
+                QuestionURL(question.url),
+                UnicodeText(u'\u2191: previous answer, \u2193: next answer, o: open in browser, \u2190: back')
+            ])
+        )
+        return answer_frame
+
+    def description_height(self):
+        """
+        Returns the number of rows given to the question description: about half of what the terminal
+        has left once the title, stats and footer are drawn.
+        """
+        return int(max(1, (self.screenHeight - 9) / 2))
+
+    def keypress(self, size, key):
+        if key in {'down', 'n', 'N'}:
+            self.answer_text.next_ans()
+        elif key in {'up', 'b', 'B'}:
+            self.answer_text.prev_ans()
+        elif key in {'o', 'O'}:
+            import webbrowser
+            if sys.platform.startswith('darwin'):
+                browser = webbrowser.get('safari')
+            else:
+                browser = webbrowser.get()
+            print_warning("Opening in your browser...")
+            browser.open(self.url)
+        elif key == 'left':
+            global question_post
+            global question_page
+            question_post = None
+            if question_page is None:
+                sys.exit(0)
+            else:
+                LOOP.widget = question_page
+        elif key == 'window resize':
+            # Only the description box depends on the terminal height. Resizing it in place keeps
+            # the rest of the widgets, the current answer and the scroll positions.
+            screenWidth, screenHeight = get_terminal_size()
+            if self.screenHeight != screenHeight:
+                self.screenHeight = screenHeight
+                self.question_text.height = self.description_height()
+                self.question_text._invalidate()
+                self._invalidate()
+
+
+class AnswerText(urwid.WidgetWrap):
+    """Answers to the question.
+
+    Long answers can be navigated up or down using the mouse.
+    """
+
+    def __init__(self, answers):
+        """
+        :param answers: list of Answer objects
+        """
+        urwid.WidgetWrap.__init__(self, UnicodeText(''))
+        self._selectable = True  # so that we receive keyboard input
+        self.answers = answers
+        self.index = 0
+        self.boxes = OrderedDict()  # Text boxes of viewed answers by index, least recently viewed first
+        self.cached_lines = 0
+        self.set_answer()
+
+    def set_answer(self):
+        """
+        We must use a box adapter to get the text to scroll when this widget is already in
+        a Pile from the main question page. Scrolling is necessary for long answers which are longer
+        than the length of the terminal.
+        The text box of each viewed answer is kept, so going back to it is instant and keeps its
+        scroll position, until answer_cache_lines is exceeded.
+        """
+        box = self.boxes.pop(self.index, None)
+        if box is None:
+            if not self.answers:
+                content = [('less-important', 'No answers for this question ...')]
+            else:
+                answer = self.answers[self.index]
+                content = [('less-important', answer_heading(answer) + ': ')] + answer.body.split("\n")
+            box = ScrollableTextBox(content)
+            self.cached_lines += len(content)
+        self.boxes[self.index] = box
+        while self.cached_lines > answer_cache_lines and len(self.boxes) > 1:
+            old_index, old_box = self.boxes.popitem(last=False)
+            self.cached_lines -= len(old_box.body)
+        self.content = box.body.lines
+        self._w = box
+
+    def prev_ans(self):
+        """go to previous answer."""
+        self.index -= 1
+        if self.index < 0:
+            self.index = 0
+            header_for_display.event('answer-bounds', "No previous answers.")
+        else:
+            header_for_display.clear('answer-bounds')
+        self.set_answer()
+
+    def next_ans(self):
+        """go to next answer."""
+        self.index += 1
+        if self.index > len(self.answers) - 1:
+            self.index = max(len(self.answers) - 1, 0)
+            header_for_display.event('answer-bounds', "No more answers.")
+        else:
+            header_for_display.clear('answer-bounds')
+        self.set_answer()
+
+    def __len__(self):
+        """ return number of rows in this widget """
+        return len(self.content)
+
+class LazyLineWalker(urwid.ListWalker):
+    """
+    List walker creating a UnicodeText widget for a line only when the ListBox displays it.
+
+    The most recently displayed widgets are kept in a bounded LRU cache, so that long answers
+    don't need a widget for each of their lines before the first paint.
+    """
+
+    def __init__(self, lines):
+        """
+        :param lines: list of text markup, one per line
+        """
+        self.lines = lines
+        self.focus = 0
+        self.widgets = OrderedDict()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self.lines):
+            raise IndexError(position)
+        widget = self.widgets.pop(position, None)
+        if widget is None:
+            widget = UnicodeText(self.lines[position])
+            if len(self.widgets) >= line_cache_size:
+                self.widgets.popitem(last=False)  # Least recently displayed line
+        self.widgets[position] = widget
+        return widget
+
+    def next_position(self, position):
+        if position + 1 >= len(self.lines):
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self.lines) - 1, -1, -1)
+        return range(len(self.lines))
+
+    def get_focus(self):
+        if not self.lines:
+            return None, None
+        return self[self.focus], self.focus
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        try:
+            position = self.next_position(position)
+        except IndexError:
+            return None, None
+        return self[position], position
+
+    def get_prev(self, position):
+        try:
+            position = self.prev_position(position)
+        except IndexError:
+            return None, None
+        return self[position], position
+
+class ScrollableListBox(urwid.ListBox):
+    """ List box which can also be scrolled with the mouse wheel """
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        SCROLL_WHEEL_UP = 4
+        SCROLL_WHEEL_DOWN = 5
+        if button == SCROLL_WHEEL_DOWN:
+            self.keypress(size, 'down')
+        elif button == SCROLL_WHEEL_UP:
+            self.keypress(size, 'up')
+        else:
+            return False
+        return True
+
+class ScrollableTextBox(ScrollableListBox):
+    """ Display input text, scrolling through when there is not enough room.
+
+    Scrolling through text takes a little work to support on Urwid.
+    """
+
+    def __init__(self, content):
+        """
+        :param content: list of lines to be displayed
+        """
+        urwid.ListBox.__init__(self, LazyLineWalker(content))
+
+class SelectableText(UnicodeText):
+    """ Text which can take the focus in a list box, so that it can be picked with the cursor """
+    _selectable = True
+
+    def keypress(self, size, key):
+        return key
+
+class QuestionTitle(UnicodeText):
+    """ Title of the question,"""
+
+    def __init__(self, title):
+        text = ["Question: ", ('title', title), "\n"]
+        UnicodeText.__init__(self, text)
+
+#Must convert to BoxAdapter object if used as a flow widget.
+class QuestionDescription(urwid.WidgetWrap):
+    """ Description of the question """
+
+    def __init__(self, description):
+        urwid.WidgetWrap.__init__(self, UnicodeText(''))
+        self.description = description
+        self.set_description()
+
+    def set_description(self):
+        """
+        We must use a box adapter to get the text to scroll when this widget is already in
+        a Pile from the main question page. Scrolling is necessary for long questions which are longer
+        than the length of the terminal.
+        """
+        self.content =  self.description.strip("\n").split("\n")
+        self._w = ScrollableTextBox(self.content)
+
+    def __len__(self):
+        """ return number of rows in this widget """
+        return len(self.content)
+
+class QuestionStats(UnicodeText):
+    """ Stats of the question,"""
+
+    def __init__(self, stats):
+        text = ["\n", ('metadata', stats)]
+        UnicodeText.__init__(self, text)
+
+class QuestionURL(UnicodeText):
+    """ url of the question """
+
+    def __init__(self, url):
+        text = ["\n", ('heading', 'Question URL: '), url]
+        UnicodeText.__init__(self, text)
+
+class SelectQuestionPage(urwid.WidgetWrap):
+
+    def display_text(self, index, question):
+        text = [
+            ("warning", u"{}. {}\n".format(index, question.title)),
+            question.desc + "\n",
+        ]
+        return text
+
+    def __init__(self, questions, query=None):
+        """
+        :param questions: list of SearchResult objects, the first page of results
+        :param query: URL encoded query the questions were found for, used to load the next pages.
+                      Only the given questions are listed if it is None.
+        """
+        self.questions = []
+        self.query = query
+        self.page = 1  # Last page of results loaded
+        self.more_results = query is not None  # False once a page comes back empty
+        self.paging = False  # True while the next page is loading
+        self.number = ''  # Digits typed so far to select a question
+        self.prefetcher = None  # Loads listed questions in the background
+        self.pager = None  # Loads the next pages of results
+        self.prefetch_count = 0
+        self.loader = None  # Loads selected questions that haven't been prefetched yet
+        self.pending = None  # Index of the selected question that is still loading
+        self.entries = urwid.SimpleFocusListWalker([])
+        self.questions_box = ScrollableListBox(self.entries)
+        self.header = UnicodeText(('less-important', 'Select a question below:\n'))
+        self.status = Header()
+        self.footer = UnicodeText('')
+        self.add_questions(questions)
+        frame = urwid.Frame(header=urwid.Pile([self.status, self.header]),
+                            body=self.questions_box,
+                            footer=self.footer)
+        urwid.WidgetWrap.__init__(self, frame)
+
+    def add_questions(self, questions):
+        """
+        Appends questions to the list, skipping those which are already listed.
+        :param questions: list of SearchResult objects
+        :return: indexes of the added questions
+        """
+        listed = set(normalize_url(question.url) for question in self.questions)
+        added = []
+        for question in questions:
+            if normalize_url(question.url) in listed:
+                continue  # Search engines may repeat a result on the next page
+            listed.add(normalize_url(question.url))
+            added.append(len(self.questions))
+            self.entries.append(urwid.AttrMap(SelectableText(self.display_text(len(self.questions), question)),
+                                              None, {None: 'focus', 'warning': 'focus'}))
+            self.questions.append(question)
+        self.show_footer()
+        return added
+
+    def show_footer(self, text=None):
+        if text is None:
+            text = '0-' + str(len(self.questions) - 1) + u' and enter or \u2191\u2193 and enter: select a question, ' \
+                   u'\u2190: cancel loading, any other key: exit.'
+            if self.number:
+                text = u'Question number: ' + self.number
+        self.footer.set_text(UnicodeText.to_unicode(text))
+
+    # Override parent method
+    def selectable(self):
+        return True
+
+    def keypress(self, size, key):
+        if key in '0123456789':
+            self.number += key
+            # Selects right away when no longer number could be a listed question
+            if self.number == '0' or int(self.number) * 10 >= len(self.questions):
+                self.select_number()
+            else:
+                self.show_footer()
+        elif key == 'backspace' and self.number:
+            self.number = self.number[:-1]
+            self.show_footer()
+        elif key == 'enter':
+            if self.number:
+                self.select_number()
+            elif self.questions:
+                self.select_question(self.question_url(self.entries.focus), self.entries.focus)
+        elif key in {'down', 'up', 'page down', 'page up', 'home', 'end'}:
+            self._w.keypress(size, key)
+            if self.entries.focus >= len(self.questions) - 1:
+                self.load_next_page()  # Scrolled to the end of the list
+        elif key == 'left' and self.pending is not None:
+            # Cancels the pending load, its result will still be kept for later
+            self.pending = None
+            self.status.event('loading', "Loading cancelled.")
+        else:
+            raise urwid.ExitMainLoop()
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        handled = self._w.mouse_event(size, event, button, col, row, focus)
+        if self.entries.focus >= len(self.questions) - 1:
+            self.load_next_page()
+        return handled
+
+    def select_number(self):
+        index = int(self.number)
+        self.number = ''
+        if index >= len(self.questions):
+            self.show_footer('Question numbers range from 0-' + str(len(self.questions) - 1) +
+                             ". Please select a valid question number.")
+            return
+        self.show_footer()
+        self.entries.set_focus(index)
+        self.select_question(self.question_url(index), index)
+
+    def question_url(self, index):
+        return self.questions[index].url
+
+    def start_prefetch(self):
+        """
+        Starts loading all the listed questions in the background, so that
+        selecting one of them usually doesn't have to wait for the network.
+        """
+        self.status.event('prefetch', "Loading questions in the background...")
+        self.prefetch(range(len(self.questions)))
+
+    def prefetch(self, indexes):
+        if self.prefetcher is None:
+            self.prefetcher = BackgroundFetcher(LOOP, self.prefetch_done)
+        for index in indexes:
+            self.prefetcher.submit(index, get_question_stats_and_answer, self.question_url(index))
+
+    def prefetch_done(self, index, data, error):
+        self.prefetch_count += 1
+        if error is None:
+            if index == self.pending:
+                self.show_question(index, data)
+        else:
+            showerror(error)
+        if self.pending is not None:
+            return  # Keep the loading message visible
+        if self.prefetch_count < len(self.questions):
+            self.status.event('prefetch', "Loaded {0}/{1} questions...".format(self.prefetch_count,
+                                                                              len(self.questions)))
+        else:
+            self.status.clear('prefetch')
+
+    def load_next_page(self):
+        """
+        Starts loading the next page of search results in the background, unless it is
+        already loading or the last page was reached.
+        """
+        if not self.more_results or self.paging:
+            return
+        self.paging = True
+        self.status.event('paging', "Loading more results...")
+        if self.pager is None:
+            self.pager = BackgroundFetcher(LOOP, self.page_done, workers=1)
+        self.pager.submit(self.page + 1, search_questions, self.query, results_per_page, self.page + 1)
+
+    def page_done(self, page, questions, error):
+        self.paging = False
+        self.status.clear('paging')
+        if error is not None:
+            showerror(error)
+            self.status.event('paging', "Could not load more results.")
+            return
+        self.page = page
+        added = self.add_questions(questions or [])
+        if not added:
+            self.more_results = False
+            self.status.event('paging', "No more results.")
+            return
+        self.prefetch(added)
+
+    def load_done(self, index, data, error):
+        if error is None:
+            if index == self.pending:
+                self.show_question(index, data)
+        elif index == self.pending:
+            showerror(error)
+            self.pending = None
+            self.status.event('loading', "Could not load question {0}.".format(index))
+
+    def select_question(self, url, index):
+        """
+        Displays the question at index. Questions opened or prefetched earlier are kept in memory by
+        get_question_stats_and_answer, only their widgets are built again. Questions which are not
+        loaded yet are fetched on a worker thread while the UI keeps running, the page is shown once they arrive.
+        """
+        data = recall_question(normalize_url(url))
+        if data is not None:
+            self.show_question(index, data)
+        else:
+            self.pending = index
+            self.status.event('loading', u"Loading question {0}... Press \u2190 to cancel.".format(index))
+            if self.loader is None:
+                self.loader = BackgroundFetcher(LOOP, self.load_done, workers=2)
+            self.loader.submit(index, get_question_stats_and_answer, url)
+
+    def show_question(self, index, data):
+        global question_post
+        self.pending = None
+        self.status.clear('loading')
+        if self.query is not None:
+            record_query(urldecode(self.query), data.url, new_use=False)
+        question_post = QuestionPage(data)
+        LOOP.widget = question_post
+
+
+def display_question(question):
+    """
+    Displays a question and its answers until the user quits.
+    :param question: Question object
+    :return:
+    """
+    global question_post
+    global header_for_display
+    global LOOP
+    header_for_display = Header()
+    question_post = QuestionPage(question)
+    LOOP = EditedMainLoop(question_post, palette)
+    LOOP.run()
+
+
+def browse_questions(questions, query=None):
+    """
+    Lists search results and lets the user browse any of them, until the user quits.
+    More results are loaded when the user scrolls past the end of the list.
+    :param questions: list of SearchResult objects, the first page of results
+    :param query: URL encoded query the questions were found for
+    :return:
+    """
+    global header_for_display
+    global question_page
+    global LOOP
+    header_for_display = Header()
+    question_page = SelectQuestionPage(questions, query)
+    LOOP = EditedMainLoop(question_page, palette)
+    question_page.start_prefetch()
+    LOOP.run()
@@ -0,0 +1,149 @@
+"""
+Checks the Stack Exchange API search engine against a local HTTP server standing in for the API:
+the batched requests it sends, and how it honors the backoff and quota fields of the responses.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import urlsplit, parse_qs
+
+import socli.socli as socli
+
+
+def question(i):
+    return {"question_id": i, "link": "https://stackoverflow.com/questions/{0}/q{0}".format(i),
+            "title": "Question {0}".format(i), "body": "<p>Body of question {0}</p>".format(i),
+            "score": 10 * i, "creation_date": 1262304000, "view_count": 100, "answer_count": 2}
+
+
+def answer(i, question_id, accepted):
+    return {"answer_id": i, "question_id": question_id, "body": "<p>Answer {0}</p>".format(i),
+            "score": i, "is_accepted": accepted, "owner": {"display_name": "user" + str(i)}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers the API methods used by socli with two questions, each with two answers
+    returned over two pages, and records the requests it gets.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        self.server.requests.append((url.path, params))
+        if url.path == "/2.2/search/advanced":
+            items, has_more = [{"question_id": 1}, {"question_id": 2}], False
+        elif url.path == "/2.2/questions/1;2" or url.path == "/2.2/questions/2":
+            ids = [int(i) for i in url.path.split("/")[-1].split(";")]
+            items, has_more = [question(i) for i in ids], False
+        elif url.path == "/2.2/questions/1;2/answers":
+            # One page per request to check that the pages are followed
+            if params.get("page") == "1":
+                items, has_more = [answer(11, 1, False), answer(21, 2, False)], True
+            else:
+                items, has_more = [answer(12, 1, True), answer(22, 2, True)], False
+        elif url.path == "/2.2/questions/2/answers":
+            items, has_more = [answer(21, 2, False), answer(22, 2, True)], False
+        elif url.path == "/2.2/answers/22":
+            items, has_more = [{"answer_id": 22, "question_id": 2}], False
+        else:
+            items, has_more = [], False
+        response = dict(self.server.extra, items=items, has_more=has_more)
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class APIEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.requests = []
+        self.server.extra = {"quota_remaining": 9000}
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.tmp = tempfile.mkdtemp()
+        self.saved = dict((name, getattr(socli, name)) for name in
+                          ("cache_file", "data_file", "se_api_url", "api_search", "offline",
+                           "api_quota_remaining", "tag", "app_data"))
+        socli.cache_file = os.path.join(self.tmp, "cache.db")
+        socli.data_file = os.path.join(self.tmp, "state.db")
+        socli.se_api_url = "http://127.0.0.1:{0}/2.2".format(self.server.server_port)
+        socli.api_search = True
+        socli.offline = False
+        socli.api_quota_remaining = None
+        socli.tag = ""
+        socli.app_data = dict()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for name, value in self.saved.items():
+            setattr(socli, name, value)
+        shutil.rmtree(self.tmp)
+
+    def paths(self):
+        return [path for path, params in self.server.requests]
+
+    def test_search_loads_questions_in_batches(self):
+        results = socli.get_questions_for_query_api("for+loop", 10, 1)
+        self.assertEqual([result.title for result in results], ["Question 1", "Question 2"])
+        self.assertEqual(self.paths(), ["/2.2/search/advanced", "/2.2/questions/1;2",
+                                        "/2.2/questions/1;2/answers", "/2.2/questions/1;2/answers"])
+        search = self.server.requests[0][1]
+        self.assertEqual((search["q"], search["site"], search["pagesize"]), ("for loop", "stackoverflow", "10"))
+        self.assertEqual([params.get("page") for path, params in self.server.requests[2:]], ["1", "2"])
+        # The questions were loaded with the search, opening one sends no request
+        loaded = socli.load_question(results[1].url)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual([(answer.body, answer.accepted, answer.author) for answer in loaded.answers],
+                         [("Answer 22", True, "user22"), ("Answer 21", False, "user21")])
+
+    def test_answer_link_opens_its_question(self):
+        loaded = socli.load_question("https://stackoverflow.com/a/22/5")
+        self.assertEqual(loaded.title, "Question 2")
+        self.assertEqual(self.paths(), ["/2.2/answers/22", "/2.2/questions/2", "/2.2/questions/2/answers"])
+
+    def test_backoff_delays_the_next_requests(self):
+        self.server.extra["backoff"] = 30
+        socli.se_api_get("/search/advanced", q="loop")
+        conn = sqlite3.connect(socli.data_file)
+        try:
+            tat = conn.execute("SELECT tat FROM rate_limits WHERE host = ?",
+                               (socli.rate_limit_host(socli.se_api_url),)).fetchone()[0]
+        finally:
+            conn.close()
+        self.assertGreater(tat, time.time() + 29)
+
+    def test_exhausted_quota_fails_without_request(self):
+        self.server.extra["quota_remaining"] = 0
+        socli.se_api_get("/search/advanced", q="loop")
+        self.assertRaises(socli.APIError, socli.se_api_get, "/search/advanced", q="loop")
+        self.assertEqual(len(self.server.requests), 1)
+        # Other socli processes see the quota too
+        socli.api_quota_remaining = None
+        self.assertRaises(socli.APIError, socli.se_api_get, "/search/advanced", q="loop")
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
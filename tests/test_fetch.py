@@ -0,0 +1,89 @@
+"""
+Checks that opening a question downloads its page only once.
+A local HTTP server stands in for Stack Overflow and counts the requests it gets.
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import socli.socli as socli
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves the question fixture for every path and counts the requests per path.
+    """
+
+    def do_GET(self):
+        with open(os.path.join(fixtures, "question.html"), "rb") as f:
+            page = f.read()
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchOnceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.hits = dict()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.tmp = tempfile.mkdtemp()
+        self.saved = dict((name, getattr(socli, name)) for name in
+                          ("cache_file", "data_file", "output_format", "api_search", "offline"))
+        socli.cache_file = os.path.join(self.tmp, "cache.db")
+        socli.data_file = os.path.join(self.tmp, "state.db")
+        socli.output_format = "text"
+        socli.api_search = False
+        socli.offline = False
+        socli.question_memory.clear()
+        socli.question_memory_used = 0
+        self.stdout = sys.stdout
+        sys.stdout = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.server.shutdown()
+        self.server.server_close()
+        for name, value in self.saved.items():
+            setattr(socli, name, value)
+        socli.question_memory.clear()
+        socli.question_memory_used = 0
+        shutil.rmtree(self.tmp)
+
+    def test_question_fetched_once(self):
+        path = "/questions/522563/accessing-the-index-in-for-loops"
+        url = "http://127.0.0.1:{0}{1}".format(self.server.server_port, path)
+        socli.dispres(url)
+        socli.dispres(url)  # Served from question_memory
+        socli.question_memory.clear()
+        socli.question_memory_used = 0
+        socli.dispres(url)  # Served from the response cache
+        output = sys.stdout.getvalue()
+        self.assertEqual(self.server.hits, {path: 1})
+        self.assertIn("How do I loop over a list with its index?", output)
+        self.assertIn("enumerate", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Checks that importing socli stays fast: the HTTP, parsing and UI libraries are only
+imported when they are first used.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+import_budget = 150  # Milliseconds importing socli.socli may take, with room for slow machines
+lazy_modules = ("requests", "urwid", "bs4")  # Modules which must not be imported by import socli.socli
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime needs Python 3.7")
+class ImportTimeTest(unittest.TestCase):
+
+    def importtime(self):
+        """
+        Imports socli.socli in a new interpreter.
+        :return: dict of imported module name to cumulative import time in microseconds
+        """
+        output = subprocess.check_output([sys.executable, "-X", "importtime", "-c", "import socli.socli"],
+                                         cwd=root, stderr=subprocess.STDOUT, universal_newlines=True)
+        modules = dict()
+        for line in output.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            modules[name.strip()] = int(cumulative)
+        return modules
+
+    def test_lazy_imports(self):
+        imported = [name for name in self.importtime() if name.split(".")[0] in lazy_modules]
+        self.assertEqual(imported, [])
+
+    def test_import_budget(self):
+        modules = self.importtime()
+        total = modules["socli.socli"] / 1000.0  # Includes the socli package and everything it imports
+        self.assertLess(total, import_budget, "import socli.socli took {0:.1f} ms".format(total))
+
+
+if __name__ == "__main__":
+    unittest.main()